@@ -0,0 +1,227 @@
+import time
+import queue
+import asyncio
+import itertools
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+import numpy as np
+
+# 價位警示引擎：每支股票各維護「向上突破」與「向下跌破」兩組已排序的價位陣列，
+# 收到新價格時以二分搜尋找出觸發的前綴 / 後綴，成本只與該股票自己的警示數量有關。
+# 警示簿只存在於目前行程的記憶體中，不跨 worker 共享也不持久化：註冊與價格推送必須落在同一個行程，
+# 因此警示功能需以單一 worker 執行（start.py 即為單一行程）；多 worker 部署時請將 /api/alerts 導向同一個 worker。
+LOCAL_WEBHOOK_HOSTS = {"localhost", "127.0.0.1", "::1"}
+RECENT_LIMIT = 1000
+
+_alerts = {}
+_books = {}
+_lock = threading.Lock()
+_ids = itertools.count(1)
+
+_delivery_queue = queue.Queue()
+_subscribers = []
+_subscribers_lock = threading.Lock()
+_recent = deque(maxlen=RECENT_LIMIT)
+_delivery_started = False
+
+
+class _TickerBook:
+    """Sorted level arrays for one ticker: 'above' fires when price >= level, 'below' when price <= level."""
+
+    def __init__(self):
+        self.above_levels = np.empty(0)
+        self.above_ids = np.empty(0, dtype=np.int64)
+        self.below_levels = np.empty(0)
+        self.below_ids = np.empty(0, dtype=np.int64)
+
+    def add(self, alert_id, level, direction):
+        if direction == "above":
+            i = np.searchsorted(self.above_levels, level, side='right')
+            self.above_levels = np.insert(self.above_levels, i, level)
+            self.above_ids = np.insert(self.above_ids, i, alert_id)
+        else:
+            i = np.searchsorted(self.below_levels, level, side='left')
+            self.below_levels = np.insert(self.below_levels, i, level)
+            self.below_ids = np.insert(self.below_ids, i, alert_id)
+
+    def remove(self, alert_id):
+        keep = self.above_ids != alert_id
+        self.above_levels, self.above_ids = self.above_levels[keep], self.above_ids[keep]
+        keep = self.below_ids != alert_id
+        self.below_levels, self.below_ids = self.below_levels[keep], self.below_ids[keep]
+
+    def match(self, price):
+        """Pops and returns the ids of every alert the price triggers (O(log n) search + slice)."""
+        hi = np.searchsorted(self.above_levels, price, side='right')
+        fired_above = self.above_ids[:hi]
+        self.above_levels, self.above_ids = self.above_levels[hi:], self.above_ids[hi:]
+
+        lo = np.searchsorted(self.below_levels, price, side='left')
+        fired_below = self.below_ids[lo:]
+        self.below_levels, self.below_ids = self.below_levels[:lo], self.below_ids[:lo]
+        return np.concatenate([fired_above, fired_below])
+
+    def __len__(self):
+        return len(self.above_ids) + len(self.below_ids)
+
+
+def _validate_webhook(webhook):
+    if webhook is None:
+        return None
+    parsed = urlparse(webhook)
+    if parsed.scheme not in ("http", "https") or parsed.hostname not in LOCAL_WEBHOOK_HOSTS:
+        raise ValueError("webhook 只允許本機位址 (localhost / 127.0.0.1)")
+    return webhook
+
+
+def register_alert(ticker, level, direction, kind="custom", webhook=None, note=None):
+    """
+    Registers a one-shot level alert. direction is "above" (price rises to level)
+    or "below" (price falls to level). Returns the alert dict.
+    """
+    if direction not in ("above", "below"):
+        raise ValueError("direction 必須是 'above' 或 'below'")
+    level = float(level)
+    if not np.isfinite(level) or level <= 0:
+        raise ValueError(f"無效的價位: {level}")
+    alert = {
+        "id": next(_ids),
+        "ticker": ticker,
+        "level": level,
+        "direction": direction,
+        "kind": kind,
+        "webhook": _validate_webhook(webhook),
+        "note": note,
+        "created_at": time.time(),
+    }
+    with _lock:
+        _alerts[alert["id"]] = alert
+        _books.setdefault(ticker, _TickerBook()).add(alert["id"], level, direction)
+    return alert
+
+
+def register_recommendation_alerts(table, webhook=None):
+    """
+    Registers entry / target / stop-loss alerts for every row of a recommendation table
+    (as produced by generate_recommendation_table).
+    """
+    created = []
+    for ticker, row in zip(table.index, table.itertuples(index=False)):
+        created.append(register_alert(ticker, row.entry_high, "below", "entry", webhook, "進入建議進場區間"))
+        created.append(register_alert(ticker, row.target_profit, "above", "target", webhook, "達到目標價"))
+        created.append(register_alert(ticker, row.stop_loss, "below", "stop_loss", webhook, "跌破停損點"))
+    return created
+
+
+def cancel_alert(alert_id):
+    with _lock:
+        alert = _alerts.pop(alert_id, None)
+        if alert is None:
+            return False
+        book = _books.get(alert["ticker"])
+        if book is not None:
+            book.remove(alert_id)
+            if not len(book):
+                del _books[alert["ticker"]]
+    return True
+
+
+def list_alerts(ticker=None):
+    with _lock:
+        return [alert for alert in _alerts.values() if ticker is None or alert["ticker"] == ticker]
+
+
+def on_price(ticker, price):
+    """Feeds one price update; fired alerts are removed and queued for delivery. Returns them."""
+    price = float(price)
+    with _lock:
+        book = _books.get(ticker)
+        if book is None:
+            return []
+        fired_ids = book.match(price)
+        if not len(book):
+            del _books[ticker]
+        fired = [_alerts.pop(int(alert_id)) for alert_id in fired_ids]
+
+    now = time.time()
+    for alert in fired:
+        event = dict(alert, price=price, fired_at=now)
+        _recent.append(event)
+        _delivery_queue.put(event)
+    if fired:
+        _ensure_delivery_thread()
+    return fired
+
+
+def on_prices(prices):
+    """Batch form of on_price for {ticker: price}."""
+    fired = []
+    for ticker, price in prices.items():
+        fired.extend(on_price(ticker, price))
+    return fired
+
+
+def recent_events(limit=100):
+    return list(_recent)[-limit:]
+
+
+def subscribe(loop):
+    """
+    Returns an asyncio.Queue bound to loop that receives every fired alert (used by the stream endpoint).
+    The delivery thread hands events over with loop.call_soon_threadsafe, so waiting streams hold no thread.
+    """
+    subscriber = asyncio.Queue(maxsize=RECENT_LIMIT)
+    with _subscribers_lock:
+        _subscribers.append((loop, subscriber))
+    return subscriber
+
+
+def unsubscribe(subscriber):
+    with _subscribers_lock:
+        _subscribers[:] = [entry for entry in _subscribers if entry[1] is not subscriber]
+
+
+def _offer(subscriber, event):
+    """Runs on the subscriber's event loop; a slow stream drops events instead of blocking delivery."""
+    try:
+        subscriber.put_nowait(event)
+    except asyncio.QueueFull:
+        pass
+
+
+def _deliver(event):
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+    for loop, subscriber in subscribers:
+        try:
+            loop.call_soon_threadsafe(_offer, subscriber, event)
+        except RuntimeError:
+            # 事件迴圈已關閉（串流中斷但尚未取消訂閱）
+            unsubscribe(subscriber)
+    if event.get("webhook"):
+        import requests
+
+        try:
+            requests.post(event["webhook"], json=event, timeout=5)
+        except Exception as e:
+            print(f"⚠️  警示 {event['id']} webhook 傳送失敗: {e}")
+
+
+def _delivery_loop():
+    while True:
+        event = _delivery_queue.get()
+        try:
+            _deliver(event)
+        except Exception as e:
+            print(f"警示傳送錯誤: {e}")
+
+
+def _ensure_delivery_thread():
+    global _delivery_started
+    with _subscribers_lock:
+        if _delivery_started:
+            return
+        _delivery_started = True
+    threading.Thread(target=_delivery_loop, daemon=True).start()
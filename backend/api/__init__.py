@@ -0,0 +1,18 @@
+import asyncio
+
+from fastapi.routing import APIRoute
+
+from profiler import root_stage
+
+
+class ProfiledRoute(APIRoute):
+    """
+    Route class for the API routers: sync endpoints run inside the profiler's implicit "request" stage,
+    so time outside the named stages still shows up in a profile. Async endpoints run on the event loop,
+    which the profiling middleware already samples under "asgi".
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        if not asyncio.iscoroutinefunction(endpoint):
+            endpoint = root_stage(endpoint)
+        super().__init__(path, endpoint, **kwargs)
@@ -0,0 +1,138 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Dict, Optional
+import json
+import asyncio
+import traceback
+
+from data_fetcher import get_stocks_by_industry
+from api import ProfiledRoute
+
+router = APIRouter(route_class=ProfiledRoute)
+
+class AlertRequest(BaseModel):
+    ticker: str
+    level: float
+    direction: str  # "above" | "below"
+    kind: str = "custom"
+    webhook: Optional[str] = None  # 只允許本機位址
+    note: Optional[str] = None
+
+class RecommendationAlertRequest(BaseModel):
+    ticker: Optional[str] = None  # 以逗號分隔
+    industry: Optional[str] = None
+    webhook: Optional[str] = None
+
+class PriceUpdateRequest(BaseModel):
+    prices: Dict[str, float]
+
+
+def _format_ticker(ticker):
+    ticker = ticker.strip().upper()
+    if not ticker.endswith('.TW') and ticker.isdigit():
+        ticker = f"{ticker}.TW"
+    return ticker
+
+
+@router.post("/alerts")
+def create_alert(request: AlertRequest):
+    """註冊單一價位警示"""
+    from alerts import register_alert
+
+    try:
+        alert = register_alert(
+            _format_ticker(request.ticker), request.level, request.direction,
+            request.kind, request.webhook, request.note
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"type": "alert", "alert": alert}
+
+
+@router.post("/alerts/recommendations")
+def create_recommendation_alerts(request: RecommendationAlertRequest):
+    """依推薦結果為每支股票註冊進場、目標價與停損警示"""
+    from alerts import register_recommendation_alerts
+    from recommender import generate_recommendation_table
+
+    try:
+        if request.ticker:
+            tickers = [_format_ticker(ticker) for ticker in request.ticker.split(',')]
+        elif request.industry:
+            tickers = get_stocks_by_industry(request.industry)
+        else:
+            raise HTTPException(status_code=400, detail="需要提供 ticker 或 industry")
+
+        table = generate_recommendation_table(tickers)
+        created = register_recommendation_alerts(table, request.webhook)
+        return {
+            "type": "alert",
+            "alerts": created,
+            "message": f"已為 {len(table)} 支股票註冊 {len(created)} 個警示"
+        }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"警示註冊錯誤: {str(e)}")
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"警示註冊失敗: {str(e)}")
+
+
+@router.get("/alerts")
+def get_alerts(ticker: Optional[str] = None):
+    """列出尚未觸發的警示"""
+    from alerts import list_alerts
+
+    alerts = list_alerts(_format_ticker(ticker) if ticker else None)
+    return {"type": "alert", "alerts": alerts, "count": len(alerts)}
+
+
+@router.delete("/alerts/{alert_id}")
+def delete_alert(alert_id: int):
+    from alerts import cancel_alert
+
+    if not cancel_alert(alert_id):
+        raise HTTPException(status_code=404, detail=f"找不到警示 {alert_id}")
+    return {"type": "alert", "message": f"已取消警示 {alert_id}"}
+
+
+@router.post("/alerts/prices")
+def push_prices(request: PriceUpdateRequest):
+    """輸入最新價格，回傳本次觸發的警示"""
+    from alerts import on_prices
+
+    fired = on_prices({_format_ticker(ticker): price for ticker, price in request.prices.items()})
+    return {"type": "alert", "fired": fired, "count": len(fired)}
+
+
+@router.get("/alerts/events")
+def get_events(limit: int = Query(100, ge=1, le=1000)):
+    """最近觸發的警示"""
+    from alerts import recent_events
+
+    return {"type": "alert", "events": recent_events(limit)}
+
+
+@router.get("/alerts/stream")
+async def stream_alerts():
+    """以 Server-Sent Events 推送觸發的警示（非同步等待，不佔用執行緒池）"""
+    from alerts import subscribe, unsubscribe
+
+    subscriber = subscribe(asyncio.get_running_loop())
+
+    async def events():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
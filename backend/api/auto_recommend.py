@@ -1,21 +1,38 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Header, Query, Request
 from pydantic import BaseModel
 import traceback
 from typing import Optional
 
-from recommender import generate_recommendations
 from data_fetcher import get_stocks_by_industry
+from response_format import negotiate_format, recommendation_response
+from resilience import request_deadline, scan_status
+from api import ProfiledRoute
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 class AutoRecommendRequest(BaseModel):
     industry: Optional[str] = None
 
 @router.post("/recommend/auto")
-def auto_recommend(request: AutoRecommendRequest = Body(...)):
+def auto_recommend(
+    http_request: Request,
+    request: AutoRecommendRequest = Body(...),
+    format: Optional[str] = Query(None, description="rows | columnar | arrow"),
+    max_correlation: Optional[float] = Query(None, ge=0, le=1, description="分散化：排除與較佳標的相關係數超過此值的股票"),
+    budget_ms: Optional[int] = Query(None, ge=100, description="延遲預算（毫秒），亦可用 X-Request-Budget-Ms 標頭"),
+    top_n: Optional[int] = Query(None, ge=1, description="只分析產業內因子綜合排名前 N 名"),
+    x_request_budget_ms: Optional[int] = Header(None)
+):
     """
     按產業推薦股票，為產業內所有股票生成評級。
+    大量結果可用 ?format=columnar / arrow 或 Accept 標頭取得欄式回應。
+    超過延遲預算的股票改用本地舊資料（列於 stale）或略過（列於 skipped）。
     """
+    # 重量級模組於第一次請求時才載入
+    from recommender import generate_recommendation_table, format_recommendations
+    from risk import diversify_table
+    from ranking import get_ranking
+
     try:
         if not request or not request.industry:
             raise HTTPException(status_code=400, detail="Industry is required.")
@@ -27,16 +44,31 @@ def auto_recommend(request: AutoRecommendRequest = Body(...)):
         if not stocks_in_industry:
             raise HTTPException(status_code=404, detail=f"找不到該產業的股票: {industry}")
 
+        if top_n is not None:
+            ranking = get_ranking()
+            if ranking is not None:
+                # 與 /api/rankings?industry= 相同：依產業內綜合分數的預先排序切片
+                stocks_in_industry = ranking.top_tickers(top_n, industry) or stocks_in_industry
+
         # Directly generate recommendations for all stocks in the industry
-        recommendations = generate_recommendations(stocks_in_industry)
-
-        return {
-            "type": "recommendation",
-            "mode": "industry",
-            "industry": industry,
-            "recommendations": recommendations,
-            "message": f"成功分析「{industry}」產業中的 {len(stocks_in_industry)} 支股票"
-        }
+        deadline = request_deadline(budget_ms or x_request_budget_ms)
+        table = generate_recommendation_table(stocks_in_industry, deadline)
+        status = scan_status(table)
+        if max_correlation is not None:
+            table = diversify_table(table, max_correlation, deadline=deadline)
+
+        return recommendation_response(
+            table,
+            negotiate_format(http_request, format),
+            format_recommendations,
+            type="recommendation",
+            mode="industry",
+            industry=industry,
+            message=f"成功分析「{industry}」產業中的 {len(stocks_in_industry)} 支股票",
+            **status
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"自動推薦錯誤: {str(e)}")
         print(traceback.format_exc())
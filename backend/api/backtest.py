@@ -1,24 +1,52 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import traceback
 
-from backtester import run_backtest
-from strategy import ma_crossover_strategy
 from data_fetcher import fetch_data
+from profiler import profile_stage
+from api import ProfiledRoute
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 class BacktestRequest(BaseModel):
     ticker: str
     start_date: str
     end_date: str
     strategy_params: Dict[str, Any]
+    engine: str = "simple"  # "simple" | "event"
+    interval: str = "1d"  # 1d | 1wk | 1mo（由日線合成）| 1m | 5m | 15m | 60m（由 1m 合成）
+    initial_capital: Optional[float] = None
+    position_pct: float = 0.1  # event 引擎：每筆部位佔權益比例
+    use_levels: bool = True  # event 引擎：使用推薦的停損 / 目標價出場
+    fill_params: Optional[Dict[str, Any]] = None  # slippage, commission_rate, min_commission, sell_tax, lot_size
+
+def _validate_interval(request):
+    """400 for unsupported intervals and for intraday ranges older than Yahoo keeps."""
+    from resampler import PERIODS_PER_YEAR, INTRADAY_HISTORY_DAYS, covers_history
+
+    if request.interval not in PERIODS_PER_YEAR:
+        raise HTTPException(status_code=400, detail=f"不支援的週期: {request.interval}")
+    if not covers_history(request.interval, request.start_date):
+        raise HTTPException(
+            status_code=400,
+            detail=f"{request.interval} 資料僅能回溯約 {INTRADAY_HISTORY_DAYS[request.interval]} 天，請縮短回測區間"
+        )
 
 @router.post("/backtest")
 def backtest(request: BacktestRequest):
     """Runs a backtest for a given ticker and strategy."""
+    # 重量級模組於第一次請求時才載入
+    from backtester import run_backtest
+    from strategy import ma_crossover_strategy
+    from resampler import PERIODS_PER_YEAR
+
     try:
+        _validate_interval(request)
+
+        if request.engine == "event":
+            return _event_backtest(request)
+
         ticker = request.ticker.strip().upper()
 
         # 為台股代碼加上 .TW 後綴（如果還沒有）
@@ -28,11 +56,13 @@ def backtest(request: BacktestRequest):
         print(f"回測股票: {ticker}")
         print(f"回測參數: {request.strategy_params}")
 
-        data = fetch_data(
-            tickers=[ticker],
-            start_date=request.start_date,
-            end_date=request.end_date
-        )
+        with profile_stage("fetch"):
+            data = fetch_data(
+                tickers=[ticker],
+                start_date=request.start_date,
+                end_date=request.end_date,
+                interval=request.interval
+            )
 
         if ticker not in data:
             raise HTTPException(status_code=404, detail=f"無法獲取 {ticker} 的數據")
@@ -43,17 +73,21 @@ def backtest(request: BacktestRequest):
         # 設置預設策略參數
         strategy_params = request.strategy_params if request.strategy_params else {"short_window": 5, "long_window": 20}
 
-        results = run_backtest(
-            data[ticker],
-            ma_crossover_strategy,
-            strategy_params
-        )
+        with profile_stage("backtest"):
+            results = run_backtest(
+                data[ticker],
+                ma_crossover_strategy,
+                strategy_params,
+                periods_per_year=PERIODS_PER_YEAR[request.interval],
+                **({"initial_capital": request.initial_capital} if request.initial_capital else {})
+            )
 
         response_data = {
             "type": "backtest",
             "symbol": ticker,
             "strategy": "Moving Average Crossover",
             "period": f"{request.start_date} to {request.end_date}",
+            "interval": request.interval,
             **results
         }
 
@@ -65,4 +99,118 @@ def backtest(request: BacktestRequest):
     except Exception as e:
         print(f"回測錯誤: {str(e)}")
         print(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=f"回測分析失敗: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"回測分析失敗: {str(e)}")
+
+
+def _event_backtest(request: BacktestRequest):
+    """Multi-ticker event-driven backtest with fees, tax, lot sizing and stop/target exits."""
+    from backtester import run_event_backtest, TaiwanFillModel, PercentOfEquitySizer
+    from strategy import ma_crossover_strategy
+    from resampler import PERIODS_PER_YEAR
+
+    tickers = []
+    for ticker in request.ticker.split(','):
+        ticker = ticker.strip().upper()
+        if not ticker.endswith('.TW') and ticker.isdigit():
+            ticker = f"{ticker}.TW"
+        tickers.append(ticker)
+
+    print(f"事件回測股票: {tickers}")
+    with profile_stage("fetch"):
+        data = fetch_data(
+            tickers=tickers, start_date=request.start_date, end_date=request.end_date, interval=request.interval
+        )
+    if not data:
+        raise HTTPException(status_code=404, detail=f"無法獲取 {', '.join(tickers)} 的數據")
+
+    strategy_params = request.strategy_params if request.strategy_params else {"short_window": 5, "long_window": 20}
+    try:
+        fill_model = TaiwanFillModel(**(request.fill_params or {}))
+    except TypeError as e:
+        raise HTTPException(status_code=400, detail=f"fill_params 參數錯誤: {e}")
+
+    with profile_stage("backtest"):
+        results = run_event_backtest(
+            data,
+            ma_crossover_strategy,
+            strategy_params,
+            initial_capital=request.initial_capital or 1000000.0,
+            fill_model=fill_model,
+            sizer=PercentOfEquitySizer(request.position_pct),
+            use_levels=request.use_levels,
+            periods_per_year=PERIODS_PER_YEAR[request.interval]
+        )
+
+    return {
+        "type": "backtest",
+        "symbol": ", ".join(results["tickers"]),
+        "strategy": "Moving Average Crossover (event-driven)",
+        "period": f"{request.start_date} to {request.end_date}",
+        "interval": request.interval,
+        **results
+    }
+
+
+class RobustnessRequest(BacktestRequest):
+    n_resamples: int = 10000
+    block_size: int = 20
+    confidence: float = 0.95
+    seed: Optional[int] = None
+
+@router.post("/backtest/robustness")
+def backtest_robustness(request: RobustnessRequest):
+    """以區塊 bootstrap 重抽樣報酬序列，回傳報酬、夏普比率與最大回撤的信賴區間"""
+    from robustness import run_robustness
+    from resampler import PERIODS_PER_YEAR
+
+    try:
+        _validate_interval(request)
+        if not 1 <= request.n_resamples <= 100000 or request.block_size < 1 or not 0 < request.confidence < 1:
+            raise HTTPException(status_code=400, detail="n_resamples、block_size 或 confidence 超出範圍")
+        if request.engine != "simple":
+            raise HTTPException(status_code=400, detail="穩健性分析目前只支援 simple 引擎的部位與成交規則")
+
+        ticker = request.ticker.strip().upper()
+        if not ticker.endswith('.TW') and ticker.isdigit():
+            ticker = f"{ticker}.TW"
+
+        with profile_stage("fetch"):
+            data = fetch_data(
+                tickers=[ticker],
+                start_date=request.start_date,
+                end_date=request.end_date,
+                interval=request.interval
+            )
+        if ticker not in data or data[ticker].empty:
+            raise HTTPException(status_code=404, detail=f"無法獲取 {ticker} 的數據")
+
+        strategy_params = request.strategy_params if request.strategy_params else {"short_window": 5, "long_window": 20}
+        with profile_stage("backtest"):
+            results = run_robustness(
+                data[ticker],
+                strategy_params,
+                n_resamples=request.n_resamples,
+                block_size=request.block_size,
+                confidence=request.confidence,
+                seed=request.seed,
+                periods_per_year=PERIODS_PER_YEAR[request.interval],
+                **({"initial_capital": request.initial_capital} if request.initial_capital else {})
+            )
+
+        return {
+            "type": "robustness",
+            "symbol": ticker,
+            "strategy": "Moving Average Crossover",
+            "period": f"{request.start_date} to {request.end_date}",
+            "interval": request.interval,
+            **results
+        }
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"穩健性分析錯誤: {str(e)}")
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"穩健性分析失敗: {str(e)}")
@@ -1,6 +1,8 @@
 from fastapi import APIRouter
 
-router = APIRouter()
+from api import ProfiledRoute
+
+router = APIRouter(route_class=ProfiledRoute)
 
 # 固定產業清單（可自行增刪）
 INDUSTRIES = [
@@ -1,17 +1,29 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header, Query, Request
 from pydantic import BaseModel
 import traceback
+from typing import Optional
 
-from recommender import generate_recommendations
+from response_format import negotiate_format, recommendation_response
+from resilience import request_deadline, scan_status
+from api import ProfiledRoute
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 class RecommendationRequest(BaseModel):
     ticker: str
 
 @router.post("/recommend")
-def recommend(request: RecommendationRequest):
+def recommend(
+    http_request: Request,
+    request: RecommendationRequest,
+    format: Optional[str] = Query(None, description="rows | columnar | arrow"),
+    budget_ms: Optional[int] = Query(None, ge=100, description="延遲預算（毫秒），亦可用 X-Request-Budget-Ms 標頭"),
+    x_request_budget_ms: Optional[int] = Header(None)
+):
     """Returns trading recommendations for a list of tickers."""
+    # 重量級模組於第一次請求時才載入
+    from recommender import generate_recommendation_table, format_recommendations
+
     try:
         # 分割股票代碼
         ticker_list = [ticker.strip().upper() for ticker in request.ticker.split(',')]
@@ -26,20 +38,21 @@ def recommend(request: RecommendationRequest):
         print(f"為指定股票生成推薦: {formatted_tickers}")
         
         # Directly generate recommendations without filtering
-        recommendations = generate_recommendations(formatted_tickers)
-        
-        if not recommendations:
-            return {
-                "type": "recommendation",
-                "recommendations": [],
-                "message": f"無法為 {', '.join(formatted_tickers)} 生成推薦，請檢查股票代碼是否正確。"
-            }
-
-        return {
-            "type": "recommendation",
-            "recommendations": recommendations,
-            "message": f"成功為 {len(recommendations)} 支股票生成推薦"
-        }
+        table = generate_recommendation_table(formatted_tickers, request_deadline(budget_ms or x_request_budget_ms))
+
+        if table.empty:
+            message = f"無法為 {', '.join(formatted_tickers)} 生成推薦，請檢查股票代碼是否正確。"
+        else:
+            message = f"成功為 {len(table)} 支股票生成推薦"
+
+        return recommendation_response(
+            table,
+            negotiate_format(http_request, format),
+            format_recommendations,
+            type="recommendation",
+            message=message,
+            **scan_status(table)
+        )
     except Exception as e:
         print(f"推薦錯誤: {str(e)}")
         print(traceback.format_exc())
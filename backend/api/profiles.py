@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import FileResponse
+from typing import Optional
+
+from profiler import is_admin_token, list_profiles, profile_path
+from api import ProfiledRoute
+
+router = APIRouter(route_class=ProfiledRoute)
+
+def _require_admin(token):
+    if not is_admin_token(token):
+        raise HTTPException(status_code=403, detail="需要管理員權限")
+
+@router.get("/profiles")
+def get_profiles(x_admin_token: Optional[str] = Header(None)):
+    """列出已儲存的請求剖析結果（含各階段耗時）"""
+    _require_admin(x_admin_token)
+    return {"profiles": list_profiles()}
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    """下載 folded stacks 格式的剖析結果，可直接交給 flamegraph.pl 或 speedscope"""
+    _require_admin(x_admin_token)
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"找不到剖析結果 {profile_id}")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+
+from api import ProfiledRoute
+
+router = APIRouter(route_class=ProfiledRoute)
+
+@router.get("/rankings")
+def rankings(
+    industry: Optional[str] = None,
+    n: int = Query(20, ge=1, le=2000)
+):
+    """回傳全市場或指定產業的因子綜合排名 Top-N（由預先計算的排名表直接切片）"""
+    # 重量級模組於第一次請求時才載入
+    from ranking import get_ranking
+
+    ranking = get_ranking()
+    if ranking is None:
+        raise HTTPException(status_code=503, detail="排名表尚未就緒，請等待價格面板更新")
+
+    return {
+        "type": "ranking",
+        "industry": industry,
+        "generation": ranking.generation,
+        "rankings": ranking.top(n, industry)
+    }
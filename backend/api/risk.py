@@ -0,0 +1,49 @@
+from fastapi import APIRouter, HTTPException, Query
+import traceback
+from typing import Optional
+
+from data_fetcher import get_stocks_by_industry
+from api import ProfiledRoute
+
+router = APIRouter(route_class=ProfiledRoute)
+
+@router.get("/risk/correlation")
+def correlation(
+    tickers: Optional[str] = Query(None, description="以逗號分隔的股票代碼"),
+    industry: Optional[str] = None,
+    window: int = Query(60, ge=5, le=250)
+):
+    """回傳指定股票（或整個產業）的滾動報酬相關係數矩陣"""
+    # 重量級模組於第一次請求時才載入
+    from risk import correlation_for
+
+    try:
+        if tickers:
+            ticker_list = []
+            for ticker in tickers.split(','):
+                ticker = ticker.strip().upper()
+                if not ticker.endswith('.TW') and ticker.isdigit():
+                    ticker = f"{ticker}.TW"
+                ticker_list.append(ticker)
+        elif industry:
+            ticker_list = get_stocks_by_industry(industry)
+        else:
+            raise HTTPException(status_code=400, detail="需要提供 tickers 或 industry")
+
+        if not ticker_list:
+            raise HTTPException(status_code=404, detail="找不到任何股票")
+
+        known, matrix = correlation_for(ticker_list, window)
+        return {
+            "type": "correlation",
+            "window": window,
+            "tickers": known,
+            "matrix": matrix.astype(float).round(3).tolist(),
+            "missing": [ticker for ticker in ticker_list if ticker not in known]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"相關性分析錯誤: {str(e)}")
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"相關性分析失敗: {str(e)}")
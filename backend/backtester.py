@@ -1,11 +1,12 @@
 import pandas as pd
 import numpy as np
-from strategy import ma_crossover_strategy
+from strategy import ma_crossover_strategy, calculate_trade_levels
 
 
-def run_backtest(data, strategy, strategy_params, initial_capital=100000.0):
+def run_backtest(data, strategy, strategy_params, initial_capital=100000.0, periods_per_year=252):
     """
     Runs a backtest on the provided data using the given strategy.
+    periods_per_year annualizes the Sharpe ratio for the bar interval (252 for daily bars).
     """
     # 創建數據副本以避免修改原始數據
     data = data.copy()
@@ -90,7 +91,7 @@ def run_backtest(data, strategy, strategy_params, initial_capital=100000.0):
 
     # 4. 夏普比率
     if portfolio['returns'].std() != 0 and not portfolio['returns'].empty:
-        sharpe_ratio = np.sqrt(252) * (portfolio['returns'].mean() / portfolio['returns'].std())
+        sharpe_ratio = np.sqrt(periods_per_year) * (portfolio['returns'].mean() / portfolio['returns'].std())
     else:
         sharpe_ratio = 0
 
@@ -111,6 +112,223 @@ def run_backtest(data, strategy, strategy_params, initial_capital=100000.0):
     }
 
 
+class TaiwanFillModel:
+    """
+    台股成交模型：滑價、券商手續費（含最低收費）、賣出證交稅 0.3%，以及整張（1000 股）交易單位。
+    """
+
+    def __init__(self, slippage=0.001, commission_rate=0.001425, min_commission=20.0,
+                 sell_tax=0.003, lot_size=1000):
+        self.slippage = slippage
+        self.commission_rate = commission_rate
+        self.min_commission = min_commission
+        self.sell_tax = sell_tax
+        self.lot_size = lot_size
+
+    def fill_price(self, price, side):
+        """Price actually paid (side=1) or received (side=-1) after slippage."""
+        return price * (1 + self.slippage * side)
+
+    def commission(self, notional):
+        return np.where(notional > 0, np.maximum(notional * self.commission_rate, self.min_commission), 0.0)
+
+    def tax(self, notional):
+        return notional * self.sell_tax
+
+    def round_shares(self, shares):
+        return np.floor(shares / self.lot_size) * self.lot_size
+
+
+class PercentOfEquitySizer:
+    """Allocates a fixed fraction of current equity to each new position."""
+
+    def __init__(self, fraction=0.1):
+        self.fraction = fraction
+
+    def target_value(self, equity):
+        return equity * self.fraction
+
+
+def _align_panel(data):
+    """Aligns {ticker: DataFrame} into (date, ticker) arrays for Open/High/Low/Close."""
+    from price_panel import normalize_ohlcv
+
+    frames = {ticker: normalize_ohlcv(df) for ticker, df in data.items() if df is not None and not df.empty}
+    tickers = list(frames)
+    index = pd.DatetimeIndex([])
+    for df in frames.values():
+        index = index.union(pd.DatetimeIndex(df.index))
+    arrays = {}
+    for field in ['Open', 'High', 'Low', 'Close']:
+        arrays[field] = np.column_stack(
+            [frames[ticker][field].reindex(index).to_numpy(dtype=float) for ticker in tickers]
+        ) if tickers else np.empty((0, 0))
+    return index, tickers, frames, arrays
+
+
+def _signal_matrix(frames, tickers, index, strategy, strategy_params):
+    """Runs the per-ticker strategy and stacks its Signal column into a (date, ticker) array."""
+    signals = np.zeros((len(index), len(tickers)))
+    for j, ticker in enumerate(tickers):
+        df = strategy(frames[ticker].copy(), **strategy_params)
+        if 'Signal' not in df.columns:
+            raise ValueError("策略沒有生成 'Signal' 列")
+        signals[:, j] = df['Signal'].reindex(index).fillna(0).to_numpy(dtype=float)
+    return signals
+
+
+def _level_matrices(high, low, close, lookback):
+    """Rolling stop-loss/target per bar, using the same formulas as generate_recommendations."""
+    support = pd.DataFrame(low).rolling(lookback, min_periods=1).min().to_numpy()
+    resistance = pd.DataFrame(high).rolling(lookback, min_periods=1).max().to_numpy()
+    levels = calculate_trade_levels(close, support, resistance)
+    valid = levels["price_range"] > 0
+    stop = np.where(valid, levels["stop_loss"], np.nan)
+    target = np.where(valid, levels["target_profit"], np.nan)
+    return stop, target
+
+
+def run_event_backtest(data, strategy, strategy_params, initial_capital=1000000.0,
+                       fill_model=None, sizer=None, use_levels=True, lookback=10, periods_per_year=252):
+    """
+    Event-driven backtest over one or many tickers.
+
+    Signals computed at the close of bar t are filled at the open of bar t+1 through the fill model.
+    Open positions exit intraday when the low touches the stop-loss or the high reaches the target
+    (levels come from calculate_trade_levels on the trailing window, as in generate_recommendations;
+    a target at or below the fill price is dropped).
+    All state lives in preallocated (date, ticker) arrays; only the per-bar loop is in Python.
+    """
+    if isinstance(data, pd.DataFrame):
+        data = {"TICKER": data}
+    fill_model = fill_model or TaiwanFillModel()
+    sizer = sizer or PercentOfEquitySizer()
+
+    index, tickers, frames, arrays = _align_panel(data)
+    if not tickers or len(index) < 2:
+        raise ValueError("回測數據不足")
+    open_, high, low, close = arrays['Open'], arrays['High'], arrays['Low'], arrays['Close']
+    signals = _signal_matrix(frames, tickers, index, strategy, strategy_params)
+    if use_levels:
+        stop_levels, target_levels = _level_matrices(high, low, close, lookback)
+    else:
+        stop_levels = target_levels = np.full(close.shape, np.nan)
+
+    n_bars, n_tickers = close.shape
+    shares = np.zeros(n_tickers)
+    entry_cost = np.zeros(n_tickers)
+    stop = np.full(n_tickers, np.nan)
+    target = np.full(n_tickers, np.nan)
+    last_close = np.full(n_tickers, np.nan)
+    equity = np.empty(n_bars)
+    cash = float(initial_capital)
+    total_commission = 0.0
+    total_tax = 0.0
+    trade_pnl = []
+    exit_reasons = {"signal": 0, "stop_loss": 0, "target": 0}
+
+    def close_positions(mask, raw_price, reason):
+        nonlocal cash, total_commission, total_tax
+        price = fill_model.fill_price(raw_price[mask], -1)
+        notional = price * shares[mask]
+        commission = fill_model.commission(notional)
+        tax = fill_model.tax(notional)
+        proceeds = notional - commission - tax
+        cash += proceeds.sum()
+        total_commission += commission.sum()
+        total_tax += tax.sum()
+        trade_pnl.extend((proceeds - entry_cost[mask]).tolist())
+        exit_reasons[reason] += int(mask.sum())
+        shares[mask] = 0
+        entry_cost[mask] = 0
+        stop[mask] = np.nan
+        target[mask] = np.nan
+
+    for t in range(n_bars):
+        bar_open = open_[t]
+        tradable = np.isfinite(bar_open)
+
+        if t > 0:
+            desired = signals[t - 1] > 0
+            entering = desired & ~(signals[t - 2] > 0) if t > 1 else desired
+
+            # 1. 訊號轉弱：開盤市價賣出
+            sell_mask = (shares > 0) & ~desired & tradable
+            if sell_mask.any():
+                close_positions(sell_mask, bar_open, "signal")
+
+            # 2. 新進場：依權益比例下單，取整張並受現金限制
+            buy_idx = np.flatnonzero(entering & (shares == 0) & tradable)
+            if buy_idx.size:
+                mark = np.where(np.isfinite(last_close), last_close, 0.0)
+                current_equity = cash + float(np.dot(shares, mark))
+                for j in buy_idx:
+                    price = fill_model.fill_price(bar_open[j], 1)
+                    budget = min(sizer.target_value(current_equity), cash)
+                    qty = fill_model.round_shares(budget / price)
+                    if qty <= 0:
+                        continue
+                    notional = price * qty
+                    commission = float(fill_model.commission(notional))
+                    if notional + commission > cash:
+                        qty -= fill_model.lot_size
+                        if qty <= 0:
+                            continue
+                        notional = price * qty
+                        commission = float(fill_model.commission(notional))
+                    cash -= notional + commission
+                    total_commission += commission
+                    shares[j] = qty
+                    entry_cost[j] = notional + commission
+                    stop[j] = stop_levels[t - 1, j]
+                    # 目標價假設在進場區間內買進；市價成交已在目標價之上時不設目標，改由訊號或停損出場，
+                    # 避免進場當根就以開盤價出場而白付來回手續費與證交稅
+                    target[j] = target_levels[t - 1, j] if target_levels[t - 1, j] > price else np.nan
+
+        # 3. 盤中觸及停損 / 目標價（跳空時以開盤價成交）
+        held = shares > 0
+        if held.any():
+            stop_hit = held & np.isfinite(stop) & (low[t] <= stop)
+            if stop_hit.any():
+                close_positions(stop_hit, np.minimum(np.where(tradable, bar_open, stop), stop), "stop_loss")
+            target_hit = (shares > 0) & np.isfinite(target) & (high[t] >= target)
+            if target_hit.any():
+                close_positions(target_hit, np.maximum(np.where(tradable, bar_open, target), target), "target")
+
+        last_close = np.where(np.isfinite(close[t]), close[t], last_close)
+        equity[t] = cash + float(np.dot(shares, np.where(np.isfinite(last_close), last_close, 0.0)))
+
+    # 期末仍持有的部位以最後收盤價計算未實現損益
+    open_mask = shares > 0
+    if open_mask.any():
+        unrealized = shares[open_mask] * last_close[open_mask] - entry_cost[open_mask]
+        trade_pnl.extend(unrealized.tolist())
+
+    trade_pnl = np.asarray(trade_pnl)
+    total_trades = len(trade_pnl)
+    profitable_trades = int((trade_pnl > 0).sum())
+    returns = np.diff(equity) / equity[:-1]
+    running_max = np.maximum.accumulate(equity)
+    drawdown = (equity - running_max) / running_max
+    std = returns.std(ddof=1) if len(returns) > 1 else 0.0
+    sharpe_ratio = np.sqrt(periods_per_year) * returns.mean() / std if std > 0 else 0.0
+
+    return {
+        "trades": int(total_trades),
+        "winRate": float(profitable_trades / total_trades * 100) if total_trades > 0 else 0.0,
+        "profitableTrades": profitable_trades,
+        "totalReturn": float((equity[-1] / initial_capital - 1) * 100),
+        "sharpeRatio": float(sharpe_ratio),
+        "maxDrawdown": float(abs(drawdown.min()) * 100),
+        "finalValue": float(equity[-1]),
+        "initialCapital": float(initial_capital),
+        "totalCommission": float(total_commission),
+        "totalTax": float(total_tax),
+        "exitReasons": exit_reasons,
+        "tickers": tickers,
+    }
+
+
 if __name__ == '__main__':
     # 測試用例
     dummy_data = {
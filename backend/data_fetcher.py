@@ -1,13 +1,18 @@
-import yfinance as yf
-import pandas as pd
-import time
-from datetime import datetime, timedelta
-import requests
+import os
 import io
+import json
+import time
 import threading
+from datetime import datetime, timedelta
+
+# yfinance / pandas / requests 在第一次使用時才匯入，讓 API 行程啟動不必等待這些套件載入
+
+STOCK_LIST_SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "stock_list.json")
 
 _stock_data_cache = None
-_cache_lock = threading.Lock()
+_cache_lock = threading.RLock()
+_refresh_started = False
+_refresh_lock = threading.Lock()
 
 def get_fallback_stocks():
     """Returns a hardcoded list of stocks as a fallback."""
@@ -27,6 +32,9 @@ def get_fallback_stocks():
 def _fetch_and_cache_tw_stock_list():
     """Internal function to fetch and cache the stock list."""
     global _stock_data_cache
+    import pandas as pd
+    import requests
+
     print("Fetching new stock list from TWSE...")
     url = "https://isin.twse.com.tw/isin/C_public.jsp?strMode=2"
     headers = {
@@ -67,6 +75,7 @@ def _fetch_and_cache_tw_stock_list():
         with _cache_lock:
             _stock_data_cache = all_stocks
         print(f"Successfully fetched and cached {len(all_stocks)} stocks.")
+        _save_stock_list_snapshot(all_stocks)
 
     except Exception as e:
         print(f"Error fetching Taiwan stock list: {e}")
@@ -74,15 +83,64 @@ def _fetch_and_cache_tw_stock_list():
             if _stock_data_cache is None: # Only use fallback if cache is empty
                 _stock_data_cache = get_fallback_stocks()
 
+def _save_stock_list_snapshot(stocks):
+    """Persists the stock list so the next process start is warm without a TWSE round trip."""
+    try:
+        os.makedirs(os.path.dirname(STOCK_LIST_SNAPSHOT), exist_ok=True)
+        tmp_path = f"{STOCK_LIST_SNAPSHOT}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(stocks, f, ensure_ascii=False)
+        os.replace(tmp_path, STOCK_LIST_SNAPSHOT)
+    except OSError as e:
+        print(f"⚠️  無法寫入股票清單快照: {e}")
+
+def load_stock_list_snapshot():
+    """Warms the in-memory cache from the local snapshot; returns True if one was loaded."""
+    global _stock_data_cache
+    try:
+        with open(STOCK_LIST_SNAPSHOT, encoding="utf-8") as f:
+            stocks = json.load(f)
+    except (OSError, ValueError):
+        return False
+    with _cache_lock:
+        if _stock_data_cache is None:
+            _stock_data_cache = stocks
+    print(f"已從快照載入 {len(stocks)} 支股票")
+    return True
+
 def update_stock_list_periodically():
     """Calls the fetching function and schedules the next call."""
     _fetch_and_cache_tw_stock_list()
-    threading.Timer(3600, update_stock_list_periodically).start()
+    timer = threading.Timer(3600, update_stock_list_periodically)
+    timer.daemon = True
+    timer.start()
+
+def start_background_refresh():
+    """
+    Starts the stock list and price panel refreshers once per process.
+    Called from the application lifespan instead of at import time.
+    """
+    global _refresh_started
+    with _refresh_lock:
+        if _refresh_started:
+            return
+        _refresh_started = True
+
+    from price_panel import update_panel_periodically
+
+    load_stock_list_snapshot()
+    threading.Thread(target=update_stock_list_periodically, daemon=True).start()
+    # Only the panel writer-lock holder actually downloads prices
+    threading.Thread(
+        target=update_panel_periodically,
+        args=(lambda: [stock['ticker'] for stock in fetch_tw_stock_list()],),
+        daemon=True
+    ).start()
 
 def fetch_tw_stock_list():
-    """Returns the cached list of stocks, fetching it if the cache is empty."""
+    """Returns the cached list of stocks, loading the snapshot or fetching it if the cache is empty."""
     with _cache_lock:
-        if _stock_data_cache is None:
+        if _stock_data_cache is None and not load_stock_list_snapshot():
             print("Cache is empty, performing initial fetch...")
             _fetch_and_cache_tw_stock_list()
         return _stock_data_cache
@@ -111,47 +169,161 @@ def get_stocks_by_industry(industry: str):
     print(f"在「{industry}」產業中找到 {len(matched_stocks)} 支股票")
     return matched_stocks
 
-def fetch_data(tickers, start_date=None, end_date=None, period="1y", interval="1d"):
-    """
-    Fetch historical stock data for multiple tickers with error handling and retry mechanism.
-    """
+def _download_batch(tickers, start_date, end_date, interval, auto_adjust=True, actions=False, deadline=None):
+    """Downloads many tickers in a single yfinance request; missing ones are left to the per-ticker retry loop."""
+    import pandas as pd
+    import yfinance as yf
+    from resilience import yahoo_breaker
+
     data = {}
-    if isinstance(tickers, str):
-        tickers = [tickers]
+    if not yahoo_breaker.allow():
+        print("⛔ Yahoo 斷路器開啟中，略過批次下載")
+        return data
+    try:
+        batch = yf.download(
+            tickers, start=start_date, end=end_date, interval=interval, progress=False,
+            auto_adjust=auto_adjust, actions=actions, group_by='ticker', threads=True,
+            timeout=deadline.timeout(10) if deadline else 10
+        )
+    except Exception as e:
+        yahoo_breaker.record(False)
+        print(f"❌ 批次獲取數據時出錯: {str(e)}")
+        return data
+    # yfinance 多半吞掉錯誤只回傳空資料，因此整批皆空也視為上游失敗
+    if batch is None or batch.empty or not isinstance(batch.columns, pd.MultiIndex):
+        yahoo_breaker.record(False)
+        return data
+    available = set(batch.columns.get_level_values(0))
+    for ticker in tickers:
+        if ticker not in available:
+            continue
+        stock_data = batch[ticker].dropna(how='all')
+        if not stock_data.empty:
+            data[ticker] = stock_data
+    yahoo_breaker.record(bool(data))
+    print(f"批次獲取 {len(data)}/{len(tickers)} 支股票")
+    return data
 
-    if not start_date and not end_date:
-        end_date = datetime.now().strftime('%Y-%m-%d')
-        start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+def download_history(tickers, start_date, end_date, interval="1d", auto_adjust=True, actions=False, deadline=None):
+    """
+    Downloads bars from Yahoo: one batched request first, then per-ticker retries for the rest.
+    With auto_adjust=False and actions=True the raw prices come back with Dividends / Stock Splits columns.
+    Retries and waits stop when the deadline runs out or the Yahoo circuit breaker is open;
+    tickers not reached are simply missing from the result. When the whole batch comes back empty
+    (Yahoo failing silently) the per-ticker retries are skipped instead of hammering Yahoo.
+    """
+    import yfinance as yf
+    from resilience import yahoo_breaker
 
+    data = {}
     print(f"開始獲取數據: {tickers}")
     print(f"時間範圍: {start_date} 到 {end_date}")
 
-    for ticker in tickers:
+    if len(tickers) > 1:
+        data.update(_download_batch(tickers, start_date, end_date, interval, auto_adjust, actions, deadline))
+        if not data:
+            print(f"⚠️  批次下載全部為空，略過 {len(tickers)} 支股票的逐一重試")
+            return data
+        tickers = [ticker for ticker in tickers if ticker not in data]
+
+    for position, ticker in enumerate(tickers):
+        if deadline is not None and deadline.expired():
+            print(f"⏱️  已超過延遲預算，略過 {len(tickers) - position} 支股票")
+            break
+        if not yahoo_breaker.allow():
+            print(f"⛔ Yahoo 斷路器開啟中，略過 {len(tickers) - position} 支股票")
+            break
         max_retries = 3
         retry_count = 0
         while retry_count < max_retries:
+            if retry_count > 0 and not yahoo_breaker.allow():
+                print(f"⛔ Yahoo 斷路器開啟中，略過 {ticker}")
+                break
             try:
                 stock_data = yf.download(
-                    ticker, start=start_date, end=end_date, interval=interval, progress=False, auto_adjust=True
+                    ticker, start=start_date, end=end_date, interval=interval, progress=False,
+                    auto_adjust=auto_adjust, actions=actions,
+                    timeout=deadline.timeout(10) if deadline else 10
                 )
+                # 單一股票回傳空資料可能是 Yahoo 沒有這檔（下市、代號錯誤），也可能是上游靜默失敗，
+                # 無法分辨，因此不計入斷路器；上游失敗由例外或整批皆空（見 _download_batch）判斷
                 if stock_data.empty:
+                    yahoo_breaker.release()
                     print(f"⚠️  {ticker}: 獲取的數據為空")
                     break
+                yahoo_breaker.record(True)
                 data[ticker] = stock_data
                 break
             except Exception as e:
+                yahoo_breaker.record(False)
                 print(f"❌ 獲取 {ticker} 數據時出錯: {str(e)}")
                 retry_count += 1
-                if retry_count < max_retries:
+                if retry_count < max_retries and (deadline is None or deadline.remaining() > 2):
                     time.sleep(2)
                 else:
-                    print(f"❌ 無法獲取 {ticker} 的數據，已達到最大重試次數")
-        if len(tickers) > 1:
+                    print(f"❌ 無法獲取 {ticker} 的數據，已達到最大重試次數或延遲預算")
+                    break
+        if len(tickers) > 1 and (deadline is None or deadline.remaining() > 1):
             time.sleep(1)
     return data
 
+def fetch_data(tickers, start_date=None, end_date=None, period="1y", interval="1d", use_panel=True, use_store=True,
+               deadline=None):
+    """
+    Fetch historical stock data for multiple tickers with error handling and retry mechanism.
+    Daily bars already in the shared price panel are served from it without any download; other daily
+    requests go through the local raw-price store and are adjusted for dividends on read.
+    1m bars come from the local intraday store. Weekly/monthly bars are resampled from 1d, and
+    5m/15m/60m from stored 1m bars when the store covers the range (otherwise downloaded directly).
+    With a deadline, tickers that cannot be refreshed in time fall back to stored data
+    (marked with df.attrs['stale'] = True) or are left out of the result.
+    """
+    from price_panel import load_panel
+    from resampler import is_derived, fetch_resampled
+
+    if is_derived(interval):
+        # 週 / 月線與 5m / 15m / 60m 由本地基礎 K 棒合成，不額外下載
+        return fetch_resampled(
+            tickers, interval, start_date=start_date, end_date=end_date, use_panel=use_panel, use_store=use_store,
+            deadline=deadline
+        )
+
+    data = {}
+    if isinstance(tickers, str):
+        tickers = [tickers]
+
+    if not start_date and not end_date:
+        end_date = datetime.now().strftime('%Y-%m-%d')
+        start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+
+    if use_panel and interval == "1d":
+        panel = load_panel()
+        if panel is not None and panel.covers(start_date):
+            data = panel.frames(tickers, start_date, end_date)
+            tickers = [ticker for ticker in tickers if ticker not in data]
+            if not tickers:
+                return data
+            print(f"價格面板命中 {len(data)} 支股票")
+
+    if use_store and interval == "1d":
+        from price_store import get_adjusted_history
+
+        data.update(get_adjusted_history(tickers, start_date, end_date, deadline=deadline))
+        return data
+
+    if use_store and interval == "1m":
+        from price_store import get_intraday_history
+
+        data.update(get_intraday_history(tickers, start_date, end_date, deadline=deadline))
+        return data
+
+    data.update(download_history(tickers, start_date, end_date, interval, deadline=deadline))
+    return data
+
 def get_ticker_info(ticker: str):
     """抓取單一股票的 yfinance info"""
+    import yfinance as yf
+
     try:
         stock = yf.Ticker(ticker)
         info = stock.info
@@ -164,7 +336,3 @@ def get_ticker_info(ticker: str):
     except Exception as e:
         print(f"取得 {ticker} 資訊失敗: {e}")
         return None
-
-# Start the background task to update the stock list cache
-update_thread = threading.Thread(target=update_stock_list_periodically, daemon=True)
-update_thread.start()
\ No newline at end of file
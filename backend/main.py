@@ -1,9 +1,32 @@
+import threading
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+
+from api import auto_recommend, manual_recommend, backtest, industries, risk, alerts, profiles, rankings
+import data_fetcher
+from profiler import ProfilingMiddleware
+
 
-from api import auto_recommend, manual_recommend, backtest, industries
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    每個行程啟動一次：先從本地快照載入股票清單，再於背景執行緒啟動定期更新，
+    讓健康檢查不必等待 TWSE / Yahoo 的網路請求。
+    """
+    data_fetcher.load_stock_list_snapshot()
+    threading.Thread(target=data_fetcher.start_background_refresh, daemon=True).start()
+    yield
 
-app = FastAPI(title="AI Trading Pro API", version="1.0.0")
+
+app = FastAPI(
+    title="AI Trading Pro API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
+)
 
 # CORS middleware - 允許前端連接
 app.add_middleware(
@@ -21,10 +44,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 管理員以 X-Profile: 1 + X-Admin-Token 觸發單一請求剖析；未觸發時直接放行
+app.add_middleware(ProfilingMiddleware)
+
 app.include_router(auto_recommend.router, prefix="/api", tags=["recommendation"])
 app.include_router(manual_recommend.router, prefix="/api", tags=["recommendation"])
 app.include_router(industries.router, prefix="/api", tags=["data"])
 app.include_router(backtest.router, prefix="/api", tags=["backtest"])
+app.include_router(risk.router, prefix="/api", tags=["risk"])
+# 警示簿為行程內狀態，/api/alerts 需由單一 worker 處理（見 alerts.py）
+app.include_router(alerts.router, prefix="/api", tags=["alerts"])
+app.include_router(rankings.router, prefix="/api", tags=["ranking"])
+app.include_router(profiles.router, prefix="/api", tags=["admin"])
 
 
 @app.get("/")
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# 共享價格面板：所有 worker / process pool 以 memmap 唯讀方式共用同一份 OHLCV 陣列。
+# 版面為 (ticker, date, field)，單一股票的資料是連續區塊，可零複製轉成 DataFrame；
+# 橫截面運算則透過 field() 取得 (date, ticker) 的 strided view。
+PANEL_DIR = os.environ.get(
+    "PRICE_PANEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "panel")
+)
+PANEL_MAX_AGE = int(os.environ.get("PRICE_PANEL_MAX_AGE", 6 * 3600))
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+_MANIFEST = "manifest.json"
+_WRITER_LOCK = "writer.lock"
+
+_panel = None
+_panel_stamp = None
+_panel_lock = threading.Lock()
+_writer_lock_fd = None
+
+
+class PricePanel:
+    """Read-only view over one generation of the shared OHLCV panel."""
+
+    def __init__(self, generation, values, dates, tickers, updated_at):
+        self.generation = generation
+        self.values = values
+        self.dates = dates
+        self.tickers = tickers
+        self.updated_at = updated_at
+        self.ticker_index = {ticker: i for i, ticker in enumerate(tickers)}
+        self.field_index = {field: i for i, field in enumerate(FIELDS)}
+
+    def __contains__(self, ticker):
+        return ticker in self.ticker_index
+
+    def field(self, name):
+        """Return the (date, ticker) matrix for one OHLCV field without copying."""
+        return self.values[:, :, self.field_index[name]].T
+
+    def frame(self, ticker, start_date=None, end_date=None):
+        """Return one ticker as an OHLCV DataFrame backed by the shared block."""
+        block = self.values[self.ticker_index[ticker]]
+        lo, hi = self._date_bounds(start_date, end_date)
+        df = pd.DataFrame(block[lo:hi], index=self.dates[lo:hi], columns=FIELDS, copy=False)
+        return df.dropna(how='all')
+
+    def frames(self, tickers, start_date=None, end_date=None):
+        """Same shape as fetch_data(): {ticker: DataFrame} for tickers present in the panel."""
+        data = {}
+        for ticker in tickers:
+            if ticker in self.ticker_index:
+                df = self.frame(ticker, start_date, end_date)
+                if not df.empty:
+                    data[ticker] = df
+        return data
+
+    def covers(self, start_date):
+        """True when the panel is fresh and its history reaches back to start_date."""
+        if time.time() - self.updated_at > PANEL_MAX_AGE or len(self.dates) == 0:
+            return False
+        return start_date is None or self.dates[0] <= pd.Timestamp(start_date)
+
+    def _date_bounds(self, start_date, end_date):
+        lo = 0 if start_date is None else int(self.dates.searchsorted(pd.Timestamp(start_date), side='left'))
+        # yfinance 的 end 為開區間，這裡保持一致
+        hi = len(self.dates) if end_date is None else int(self.dates.searchsorted(pd.Timestamp(end_date), side='left'))
+        return lo, hi
+
+
+def normalize_ohlcv(df):
+    """Flatten yfinance MultiIndex columns and keep only the OHLCV fields."""
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.copy()
+        df.columns = df.columns.get_level_values(0)
+    return df.reindex(columns=FIELDS)
+
+
+def _read_manifest():
+    try:
+        with open(os.path.join(PANEL_DIR, _MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_panel(data, dtype=np.float32):
+    """
+    將 {ticker: DataFrame} 寫成新一代的共享面板。
+    先寫好陣列檔，最後以 os.replace 原子性地切換 manifest，讀者不會看到寫到一半的資料。
+    """
+    os.makedirs(PANEL_DIR, exist_ok=True)
+    frames = {ticker: normalize_ohlcv(df) for ticker, df in data.items() if df is not None and not df.empty}
+    tickers = sorted(frames)
+    dates = pd.DatetimeIndex([])
+    for df in frames.values():
+        dates = dates.union(pd.DatetimeIndex(df.index))
+
+    manifest = _read_manifest()
+    generation = (manifest["generation"] + 1) if manifest else 1
+    prices_file = f"prices-{generation}.npy"
+    dates_file = f"dates-{generation}.npy"
+
+    values = np.lib.format.open_memmap(
+        os.path.join(PANEL_DIR, prices_file), mode='w+', dtype=dtype,
+        shape=(len(tickers), len(dates), len(FIELDS))
+    )
+    for i, ticker in enumerate(tickers):
+        values[i] = frames[ticker].reindex(dates).to_numpy(dtype=dtype)
+    values.flush()
+    del values
+    np.save(os.path.join(PANEL_DIR, dates_file), dates.values.astype('datetime64[ns]'))
+
+    new_manifest = {
+        "generation": generation,
+        "prices": prices_file,
+        "dates": dates_file,
+        "tickers": tickers,
+        "fields": FIELDS,
+        "updated_at": time.time(),
+    }
+    tmp_path = os.path.join(PANEL_DIR, f"{_MANIFEST}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(new_manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(PANEL_DIR, _MANIFEST))
+
+    _remove_old_generations(generation)
+    print(f"✅ 價格面板已更新: 第 {generation} 代, {len(tickers)} 支股票 x {len(dates)} 天")
+    return generation
+
+
+def _remove_old_generations(current):
+    """Keep the current and previous generation so in-flight readers stay valid."""
+    for name in os.listdir(PANEL_DIR):
+        if not name.endswith(".npy"):
+            continue
+        try:
+            generation = int(name.rsplit("-", 1)[1].split(".")[0])
+        except (IndexError, ValueError):
+            continue
+        if generation < current - 1:
+            try:
+                os.remove(os.path.join(PANEL_DIR, name))
+            except OSError:
+                pass
+
+
+def load_panel():
+    """
+    Returns the latest panel generation, memory-mapped read-only.
+    Re-opens only when the manifest points at a newer generation.
+    """
+    global _panel, _panel_stamp
+    try:
+        st = os.stat(os.path.join(PANEL_DIR, _MANIFEST))
+    except OSError:
+        return None
+    # manifest 以 os.replace 更新，inode / mtime 未變即代表仍是同一代，不必重新解析
+    stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+    if _panel is not None and _panel_stamp == stamp:
+        return _panel
+    manifest = _read_manifest()
+    if manifest is None:
+        return None
+    with _panel_lock:
+        if _panel is not None and _panel.generation == manifest["generation"]:
+            _panel_stamp = stamp
+            return _panel
+        try:
+            values = np.load(os.path.join(PANEL_DIR, manifest["prices"]), mmap_mode='r')
+            dates = pd.DatetimeIndex(np.load(os.path.join(PANEL_DIR, manifest["dates"])))
+        except (OSError, ValueError) as e:
+            print(f"⚠️  無法載入價格面板: {e}")
+            return _panel
+        _panel = PricePanel(manifest["generation"], values, dates, manifest["tickers"], manifest["updated_at"])
+        _panel_stamp = stamp
+        return _panel
+
+
+def _acquire_writer_lock():
+    """
+    Only one process on the host refreshes the panel; the rest are readers.
+    The writer holds an exclusive flock on the lock file for its whole life; the kernel releases it
+    when the process dies, so a crashed writer never leaves a stale lock and no PID checks are needed.
+    """
+    import fcntl
+
+    global _writer_lock_fd
+    if _writer_lock_fd is not None:
+        return True
+    os.makedirs(PANEL_DIR, exist_ok=True)
+    fd = os.open(os.path.join(PANEL_DIR, _WRITER_LOCK), os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    # PID 只供除錯查看，鎖本身由 flock 決定
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    _writer_lock_fd = fd
+    return True
+
+
+def refresh_panel(tickers, days=400):
+    """Download the universe once and publish it as a new panel generation."""
+    from data_fetcher import fetch_data
+
+    end_date = datetime.now().strftime('%Y-%m-%d')
+    start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+    data = fetch_data(tickers, start_date=start_date, end_date=end_date, interval="1d", use_panel=False)
+    if not data:
+        print("⚠️  價格面板更新失敗: 沒有取得任何數據")
+        return None
+    return write_panel(data)
+
+
+def update_panel_periodically(get_tickers, interval=PANEL_MAX_AGE // 2):
+    """Refreshes the panel if this process holds the writer lock, then reschedules itself."""
+    if _acquire_writer_lock():
+        try:
+            refresh_panel(get_tickers())
+        except Exception as e:
+            print(f"價格面板更新錯誤: {e}")
+    timer = threading.Timer(interval, update_panel_periodically, args=(get_tickers, interval))
+    timer.daemon = True
+    timer.start()
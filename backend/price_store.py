@@ -0,0 +1,347 @@
+import os
+import time
+import pickle
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from price_panel import FIELDS
+
+# 本地價格庫：保存未還原除息的 OHLCV 與除權息 / 分割事件表，讀取時才以累積因子向量化還原。
+# 發生除息時只需抓到包含該事件的最新幾根 K 棒，不必重抓整段已還原的歷史。
+# Yahoo 在 auto_adjust=False 時仍會依下載當時已知的分割調整價量，因此庫存的 K 棒
+# 一律保持在最近一次下載的分割基準上：出現新的分割時重抓整段歷史，讀取時只還原股利。
+STORE_DIR = os.environ.get(
+    "PRICE_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "prices")
+)
+STORE_MAX_AGE = int(os.environ.get("PRICE_STORE_MAX_AGE", 3600))
+ACTION_COLUMNS = ['Dividends', 'Stock Splits']
+# 分鐘線基礎序列（5m / 15m / 60m 由此合成）：Yahoo 的 1m 資料單次請求最多約 7 天，
+# 因此只補抓最新的一段並累積在本地，同一檔的各種分鐘週期共用同一份 1m K 棒。
+INTRADAY_INTERVAL = "1m"
+INTRADAY_MAX_AGE = int(os.environ.get("PRICE_STORE_INTRADAY_MAX_AGE", 300))
+INTRADAY_REQUEST_DAYS = 7
+
+# 只快取最近使用的紀錄，避免面板寫入行程把整個市場的完整歷史留在記憶體中
+_STORE_CACHE_SIZE = int(os.environ.get("PRICE_STORE_CACHE_SIZE", 256))
+_store = OrderedDict()
+_store_lock = threading.Lock()
+
+
+def _path(ticker, interval="1d"):
+    directory = STORE_DIR if interval == "1d" else os.path.join(STORE_DIR, interval)
+    return os.path.join(directory, f"{ticker}.pkl")
+
+
+def load_raw(ticker, interval="1d"):
+    """
+    Returns the stored record for a ticker: {"bars", "actions", "fetched_at", "covered_from"},
+    or None if nothing is stored yet. A record whose bars straddle a split that Yahoo applied
+    only to the newer download also carries "rebuild_from" (the split date) until it is re-downloaded.
+    Intraday records (interval="1m") hold only {"bars", "fetched_at", "covered_from"}.
+    """
+    key = (interval, ticker)
+    with _store_lock:
+        record = _store.get(key)
+        if record is not None:
+            _store.move_to_end(key)
+    if record is not None:
+        return record
+    try:
+        with open(_path(ticker, interval), "rb") as f:
+            record = pickle.load(f)
+    except Exception as e:
+        # 其他 pandas 版本寫入的檔案可能拋出 AttributeError / TypeError / ModuleNotFoundError，一律視為未儲存
+        if not isinstance(e, FileNotFoundError):
+            print(f"⚠️  {ticker}: 無法讀取本地價格庫 ({e})，將重新下載")
+        return None
+    _remember(key, record)
+    return record
+
+
+def _remember(key, record):
+    """Keeps a record in the bounded in-process LRU cache."""
+    with _store_lock:
+        _store[key] = record
+        _store.move_to_end(key)
+        while len(_store) > _STORE_CACHE_SIZE:
+            _store.popitem(last=False)
+
+
+def save_raw(ticker, record, interval="1d"):
+    """Writes a ticker record atomically and keeps it in the in-process LRU cache."""
+    path = _path(ticker, interval)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    _remember((interval, ticker), record)
+
+
+def _split_download(df):
+    """Splits a raw yfinance download (auto_adjust=False, actions=True) into bars and non-zero actions."""
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.copy()
+        df.columns = df.columns.get_level_values(0)
+    bars = df.reindex(columns=FIELDS).dropna(how='all')
+    actions = df.reindex(columns=ACTION_COLUMNS).fillna(0.0)
+    actions = actions[(actions != 0).any(axis=1)]
+    return bars, actions
+
+
+def _merge(old, new):
+    """Appends new rows; rows for an existing date are replaced by the newer download."""
+    if old is None or old.empty:
+        return new.sort_index()
+    if new.empty:
+        return old
+    merged = pd.concat([old, new])
+    return merged[~merged.index.duplicated(keep='last')].sort_index()
+
+
+def adjustment_factors(dates, close, actions):
+    """
+    Cumulative price factor for each bar, matching Yahoo's adjusted close.
+
+    Stored bars are already split-adjusted by Yahoo, so only dividends remain: each dividend on
+    ex-date e scales every earlier bar by 1 - dividend / close(e-1).
+    The factor of bar t is the product over all dividends after t (a reversed cumprod).
+    """
+    n = len(dates)
+    factor = np.ones(n)
+    if n == 0 or actions is None or actions.empty:
+        return factor
+
+    # 事件記在除息日前一根 K 棒上，反向累乘後即套用到該日（含）以前的所有 K 棒
+    positions = dates.searchsorted(pd.DatetimeIndex(actions.index), side='left') - 1
+    dividends = actions['Dividends'].to_numpy(dtype=float)
+    valid = (positions >= 0) & (dividends > 0)
+    positions = positions[valid]
+    dividends = dividends[valid]
+
+    prev_close = close[positions]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dividend_factor = np.where(prev_close > 0, 1.0 - dividends / prev_close, 1.0)
+    dividend_factor = np.clip(np.nan_to_num(dividend_factor, nan=1.0), 0.0, 1.0)
+    np.multiply.at(factor, positions, dividend_factor)
+    return np.cumprod(factor[::-1])[::-1]
+
+
+def apply_adjustments(bars, actions):
+    """Returns dividend-adjusted OHLCV: prices times the cumulative factor, volume unchanged."""
+    if bars.empty:
+        return bars
+    close = bars['Close'].to_numpy(dtype=float)
+    factor = adjustment_factors(bars.index, close, actions)
+    values = bars[['Open', 'High', 'Low', 'Close']].to_numpy(dtype=float) * factor[:, None]
+    adjusted = pd.DataFrame(values, index=bars.index, columns=['Open', 'High', 'Low', 'Close'])
+    adjusted['Volume'] = bars['Volume'].to_numpy(dtype=float)
+    return adjusted
+
+
+def _new_split_date(record, actions):
+    """
+    Date of the earliest split in a fresh download that the stored bars predate and do not know about,
+    i.e. the stored bars are still on the pre-split basis. None when the bars stay consistent.
+    """
+    if record is None or record["bars"].empty or actions.empty:
+        return None
+    splits = actions.index[actions['Stock Splits'].to_numpy(dtype=float) > 0]
+    known = record["actions"].index[record["actions"]['Stock Splits'].to_numpy(dtype=float) > 0]
+    new = splits[~splits.isin(known) & (splits > record["bars"].index[0])]
+    return new.min() if len(new) else None
+
+
+def _plan_downloads(tickers, start_date, now):
+    """
+    Groups tickers by (window_start, window_end, replace) still to be downloaded:
+    full history for new tickers, a backfill when the request starts earlier than what is stored,
+    and a short tail refresh (from the last stored bar) when the record is stale.
+    Records waiting for a post-split rebuild re-download their whole history and replace the bars.
+    """
+    tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+    plan = {}
+    for ticker in tickers:
+        record = load_raw(ticker)
+        if record is None or record["bars"].empty:
+            plan.setdefault((start_date, tomorrow, False), []).append(ticker)
+            continue
+        bars = record["bars"]
+        if record.get("rebuild_from") is not None:
+            covered_from = record["covered_from"]
+            if start_date and pd.Timestamp(start_date) < pd.Timestamp(covered_from):
+                covered_from = start_date
+            plan.setdefault((covered_from, tomorrow, True), []).append(ticker)
+            continue
+        if start_date and pd.Timestamp(start_date) < pd.Timestamp(record["covered_from"]):
+            first = (bars.index[0] + timedelta(days=1)).strftime('%Y-%m-%d')
+            plan.setdefault((start_date, first, False), []).append(ticker)
+        if now - record["fetched_at"] > STORE_MAX_AGE:
+            last = bars.index[-1].strftime('%Y-%m-%d')
+            plan.setdefault((last, tomorrow, False), []).append(ticker)
+    return plan
+
+
+def update_store(tickers, start_date=None, deadline=None, _rebuild_pass=False):
+    """
+    Downloads only the missing raw windows (with their corporate actions) and merges them into the store.
+    A download that reveals a split newer than the stored bars marks the record for a rebuild,
+    which is done in a second pass within the same call (time permitting).
+    """
+    from data_fetcher import download_history
+
+    now = time.time()
+    rebuild = []
+    for (window_start, window_end, replace), group in _plan_downloads(tickers, start_date, now).items():
+        if deadline is not None and deadline.expired():
+            print(f"⏱️  已超過延遲預算，{len(group)} 支股票改用本地資料")
+            continue
+        downloaded = download_history(
+            group, window_start, window_end, interval="1d", auto_adjust=False, actions=True, deadline=deadline
+        )
+        for ticker in group:
+            record = load_raw(ticker) or {
+                "bars": pd.DataFrame(columns=FIELDS, dtype=float),
+                "actions": pd.DataFrame(columns=ACTION_COLUMNS, dtype=float),
+                "fetched_at": 0.0,
+                "covered_from": window_start or datetime.now().strftime('%Y-%m-%d'),
+            }
+            if ticker not in downloaded:
+                continue
+            bars, actions = _split_download(downloaded[ticker])
+            covered_from = record["covered_from"]
+            if window_start and pd.Timestamp(window_start) < pd.Timestamp(covered_from):
+                covered_from = window_start
+            if replace:
+                save_raw(ticker, {"bars": bars, "actions": actions, "fetched_at": now, "covered_from": covered_from})
+                continue
+            rebuild_from = record.get("rebuild_from") or _new_split_date(record, actions)
+            if rebuild_from is not None:
+                rebuild.append(ticker)
+            save_raw(ticker, {
+                "bars": _merge(record["bars"], bars),
+                "actions": _merge(record["actions"], actions),
+                "fetched_at": now,
+                "covered_from": covered_from,
+                "rebuild_from": rebuild_from,
+            })
+
+    if rebuild and not _rebuild_pass:
+        print(f"🔁 {len(rebuild)} 支股票出現新的分割，重新下載完整歷史")
+        update_store(rebuild, start_date, deadline, _rebuild_pass=True)
+
+
+def get_adjusted_history(tickers, start_date=None, end_date=None, deadline=None):
+    """
+    Same shape as fetch_data(): {ticker: adjusted OHLCV DataFrame} for [start_date, end_date).
+    Tickers whose refresh failed or ran out of time are served from the last stored bars
+    with adjusted.attrs['stale'] = True; while a post-split rebuild is pending only the bars
+    from the split onward (the ones already on the new basis) are served.
+    """
+    update_store(tickers, start_date, deadline)
+    now = time.time()
+    data = {}
+    for ticker in tickers:
+        record = load_raw(ticker)
+        if record is None or record["bars"].empty:
+            continue
+        bars = record["bars"]
+        rebuild_from = record.get("rebuild_from")
+        if rebuild_from is not None:
+            bars = bars[bars.index >= rebuild_from]
+        adjusted = apply_adjustments(bars, record["actions"])
+        if start_date:
+            adjusted = adjusted[adjusted.index >= pd.Timestamp(start_date)]
+        if end_date:
+            adjusted = adjusted[adjusted.index < pd.Timestamp(end_date)]
+        if adjusted.empty:
+            print(f"⚠️  {ticker}: 獲取的數據為空")
+            continue
+        adjusted.attrs['stale'] = rebuild_from is not None or now - record["fetched_at"] > STORE_MAX_AGE
+        data[ticker] = adjusted
+    return data
+
+
+def _intraday_bars(df):
+    """OHLCV of a 1m download with a tz-naive exchange-time index (comparable with date strings)."""
+    bars = _split_download(df)[0]
+    if bars.index.tz is not None:
+        bars.index = bars.index.tz_localize(None)
+    return bars
+
+
+def update_intraday(tickers, deadline=None):
+    """Downloads only the 1m bars after the last stored one (at most the last INTRADAY_REQUEST_DAYS days)."""
+    from data_fetcher import download_history
+
+    now = time.time()
+    earliest = datetime.now() - timedelta(days=INTRADAY_REQUEST_DAYS - 1)
+    tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+    plan = {}
+    for ticker in tickers:
+        record = load_raw(ticker, INTRADAY_INTERVAL)
+        if record is not None and now - record["fetched_at"] <= INTRADAY_MAX_AGE:
+            continue
+        start = earliest
+        if record is not None and not record["bars"].empty:
+            start = max(start, record["bars"].index[-1].to_pydatetime())
+        plan.setdefault(start.strftime('%Y-%m-%d'), []).append(ticker)
+
+    for window_start, group in plan.items():
+        if deadline is not None and deadline.expired():
+            print(f"⏱️  已超過延遲預算，{len(group)} 支股票改用本地分鐘資料")
+            continue
+        downloaded = download_history(group, window_start, tomorrow, interval=INTRADAY_INTERVAL, deadline=deadline)
+        for ticker in group:
+            if ticker not in downloaded:
+                continue
+            record = load_raw(ticker, INTRADAY_INTERVAL)
+            save_raw(ticker, {
+                "bars": _merge(record["bars"] if record else None, _intraday_bars(downloaded[ticker])),
+                "fetched_at": now,
+                "covered_from": record["covered_from"] if record else window_start,
+            }, INTRADAY_INTERVAL)
+
+
+def intraday_covers(tickers, start_date):
+    """
+    Whether 1m bars back to start_date can come from the store: either Yahoo still serves them
+    in one request, or every ticker's stored bars already reach back that far.
+    """
+    if not start_date:
+        return False
+    start = pd.Timestamp(start_date)
+    if start >= pd.Timestamp((datetime.now() - timedelta(days=INTRADAY_REQUEST_DAYS - 1)).date()):
+        return True
+    for ticker in tickers:
+        record = load_raw(ticker, INTRADAY_INTERVAL)
+        if record is None or pd.Timestamp(record["covered_from"]) > start:
+            return False
+    return True
+
+
+def get_intraday_history(tickers, start_date=None, end_date=None, deadline=None):
+    """Same shape as fetch_data() for 1m bars, served from the intraday store after a tail refresh."""
+    update_intraday(tickers, deadline)
+    now = time.time()
+    data = {}
+    for ticker in tickers:
+        record = load_raw(ticker, INTRADAY_INTERVAL)
+        if record is None or record["bars"].empty:
+            continue
+        bars = record["bars"]
+        if start_date:
+            bars = bars[bars.index >= pd.Timestamp(start_date)]
+        if end_date:
+            bars = bars[bars.index < pd.Timestamp(end_date)]
+        if bars.empty:
+            print(f"⚠️  {ticker}: 獲取的數據為空")
+            continue
+        bars = bars.copy()
+        bars.attrs['stale'] = now - record["fetched_at"] > INTRADAY_MAX_AGE
+        data[ticker] = bars
+    return data
@@ -0,0 +1,201 @@
+import os
+import sys
+import hmac
+import json
+import time
+import threading
+import contextvars
+import functools
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from urllib.parse import parse_qs
+
+# 單一請求的取樣剖析：管理員以 X-Profile: 1（或 ?profile=1）加上 X-Admin-Token 觸發，
+# 取樣結果存成 flamegraph.pl / speedscope 可讀的 folded stacks，並以 fetch / indicators /
+# scoring / formatting 等階段作為堆疊前綴。未觸發時中介層直接放行，profile_stage 只做一次 contextvar 讀取。
+# 整個請求都會被取樣：端點函式本身包在隱含的 "request" 階段中（見 api.ProfiledRoute），事件迴圈上的
+# 路由、驗證與回應序列化則記在 "asgi" 階段；具名階段成為其下的子堆疊。
+PROFILE_DIR = os.environ.get(
+    "PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "profiles")
+)
+PROFILE_ADMIN_TOKEN = os.environ.get("PROFILE_ADMIN_TOKEN")
+SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.001))
+
+_active = contextvars.ContextVar("active_profile", default=None)
+_NULL_STAGE = nullcontext()
+
+
+class ProfileSession:
+    """Samples the stacks of the threads that enter a stage of one request."""
+
+    def __init__(self, name):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{threading.get_ident() % 100000}"
+        self.name = name
+        self.samples = Counter()
+        self.stage_stacks = {}
+        self.stage_time = defaultdict(float)
+        self.started_at = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.elapsed = time.perf_counter() - self.started_at
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            for ident, stages in list(self.stage_stacks.items()):
+                frame = frames.get(ident)
+                if frame is None or not stages:
+                    continue
+                self.samples[";".join(stages) + ";" + _collapse(frame)] += 1
+
+    @contextmanager
+    def stage(self, name):
+        ident = threading.get_ident()
+        stages = self.stage_stacks.setdefault(ident, [])
+        stages.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_time[";".join(stages)] += time.perf_counter() - start
+            stages.pop()
+
+    def save(self):
+        """Writes <id>.folded (flamegraph input) and <id>.json (stage wall times) under PROFILE_DIR."""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, f"{self.id}.folded"), "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        summary = {
+            "id": self.id,
+            "request": self.name,
+            "elapsed": self.elapsed,
+            "samples": sum(self.samples.values()),
+            "sample_interval": SAMPLE_INTERVAL,
+            "stages": dict(self.stage_time),
+        }
+        with open(os.path.join(PROFILE_DIR, f"{self.id}.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return summary
+
+
+def _collapse(frame):
+    """Root-first 'func (file:line)' frames joined with ';'."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def profile_stage(name):
+    """Annotates a block as a named stage when the current request is being profiled; no-op otherwise."""
+    session = _active.get()
+    if session is None:
+        return _NULL_STAGE
+    return session.stage(name)
+
+
+def profiled(name):
+    """Decorator form of profile_stage for functions that are a stage as a whole."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            session = _active.get()
+            if session is None:
+                return func(*args, **kwargs)
+            with session.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def root_stage(endpoint):
+    """Wraps a sync endpoint so its threadpool thread is sampled under "request" for the whole call."""
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        session = _active.get()
+        if session is None:
+            return endpoint(*args, **kwargs)
+        with session.stage("request"):
+            return endpoint(*args, **kwargs)
+    return wrapper
+
+
+def is_admin_token(token):
+    return bool(PROFILE_ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN)
+
+
+def _wants_profile(scope):
+    headers = dict(scope.get("headers") or [])
+    flagged = headers.get(b"x-profile") == b"1"
+    if not flagged and b"profile=" in scope.get("query_string", b""):
+        flagged = parse_qs(scope["query_string"].decode("latin-1")).get("profile") == ["1"]
+    if not flagged:
+        return False
+    token = headers.get(b"x-admin-token")
+    return is_admin_token(token.decode("latin-1") if token else None)
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware: passes requests straight through unless an admin asked for a profile."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILE_ADMIN_TOKEN or not _wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(f"{scope['method']} {scope['path']}")
+        token = _active.set(session)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", session.id.encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        session.start()
+        try:
+            # 事件迴圈執行緒：路由、參數驗證、回應序列化與傳送（同時段的其他請求也會被取樣到）
+            with session.stage("asgi"):
+                await self.app(scope, receive, send_with_profile_id)
+        finally:
+            session.stop()
+            _active.reset(token)
+            summary = session.save()
+            print(f"🔬 已儲存剖析結果 {session.id}: {summary['samples']} 個樣本, {summary['elapsed']:.3f}s")
+
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if name.endswith(".json"):
+            with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+                profiles.append(json.load(f))
+    return profiles
+
+
+def profile_path(profile_id, kind="folded"):
+    """Path of a stored profile file, or None if it does not exist (ids are never used as raw paths)."""
+    if not profile_id.replace("-", "").isdigit():
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.{kind}")
+    return path if os.path.isfile(path) else None
@@ -0,0 +1,122 @@
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from price_panel import load_panel
+
+# 橫截面排名：一次對整個價格面板計算所有股票的因子值，轉成全市場與產業內的百分位排名，
+# 再取平均得到綜合分數。排名表依面板世代快取，並預先排序，Top-N 查詢只需切片。
+FACTOR_LOOKBACK = 21
+FACTORS = ["volume_ratio", "volatility", "momentum_5d", "rsi_health"]
+
+_ranking = None
+_ranking_lock = threading.Lock()
+
+
+class RankingTable:
+    """Precomputed factor ranks for one panel generation, with presorted overall and per-industry orders."""
+
+    def __init__(self, generation, table):
+        self.generation = generation
+        self.table = table
+        self.records = table.reset_index().to_dict(orient="records")
+        self.tickers = table.index.to_numpy()
+        composite = table["composite"].to_numpy()
+        self.order = np.argsort(-np.nan_to_num(composite, nan=-1.0), kind="stable")
+        industry_composite = np.nan_to_num(table["industry_composite"].to_numpy(), nan=-1.0)
+        self.industry_order = {}
+        for industry, positions in table.groupby("industry", sort=False).indices.items():
+            self.industry_order[industry] = positions[np.argsort(-industry_composite[positions], kind="stable")]
+
+    def top(self, n=20, industry=None):
+        """Top-N rows by composite score, overall or within one industry (by industry-relative score)."""
+        order = self.order if industry is None else self.industry_order.get(industry, np.empty(0, dtype=np.intp))
+        return [self.records[i] for i in order[:n]]
+
+    def top_tickers(self, n=20, industry=None):
+        """Tickers of top(n, industry), in the same order, without building the row dicts."""
+        order = self.order if industry is None else self.industry_order.get(industry, np.empty(0, dtype=np.intp))
+        return self.tickers[order[:n]].tolist()
+
+
+def compute_factors(high, low, close, volume):
+    """
+    Factor values for every ticker from (date, ticker) matrices, all vectorized across the universe.
+    Mirrors the find_candidates rules as continuous values instead of fixed thresholds.
+    """
+    avg_volume = np.nanmean(volume[-20:], axis=0)
+    prev_close = np.vstack([np.full((1, close.shape[1]), np.nan), close[:-1]])
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    atr = np.nanmean(true_range[-14:], axis=0)
+
+    delta = np.diff(close[-15:], axis=0)
+    gain = np.nanmean(np.where(delta > 0, delta, 0.0), axis=0)
+    loss = np.nanmean(np.where(delta < 0, -delta, 0.0), axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        volume_ratio = volume[-1] / avg_volume
+        volatility = atr / close[-1]
+        momentum_5d = np.abs(close[-1] / close[-6] - 1)
+        rsi = 100 - 100 / (1 + gain / loss)
+    rsi_health = 1 - np.abs(rsi - 50) / 50
+
+    return {
+        "volume_ratio": volume_ratio,
+        "volatility": volatility,
+        "momentum_5d": momentum_5d,
+        "rsi_health": rsi_health,
+        "rsi": rsi,
+        "close": close[-1],
+    }
+
+
+def build_ranking(panel, industries):
+    """Computes the ranked table for a panel generation; only the trailing FACTOR_LOOKBACK bars are read."""
+    window = slice(-FACTOR_LOOKBACK, None)
+    # 停牌或新上市股票的整欄 NaN 會讓 nanmean 發出警告，結果本來就是 NaN，直接忽略
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        factors = compute_factors(
+            np.asarray(panel.field('High')[window], dtype=np.float64),
+            np.asarray(panel.field('Low')[window], dtype=np.float64),
+            np.asarray(panel.field('Close')[window], dtype=np.float64),
+            np.asarray(panel.field('Volume')[window], dtype=np.float64),
+        )
+    table = pd.DataFrame(factors, index=pd.Index(panel.tickers, name="ticker"))
+    table = table.replace([np.inf, -np.inf], np.nan)
+    table.insert(0, "industry", [industries.get(ticker, "") for ticker in table.index])
+    # 最後一日沒有 K 棒（停牌、最新下載缺漏）的股票因子為 NaN；rank().mean() 會略過 NaN，
+    # 只剩部分因子的股票可能排到最前面，因此全部因子都必須有值才參與排名
+    table = table.dropna(subset=FACTORS)
+
+    ranks = table[FACTORS].rank(pct=True)
+    industry_ranks = table.groupby("industry")[FACTORS].rank(pct=True)
+    table["composite"] = ranks.mean(axis=1)
+    table["industry_composite"] = industry_ranks.mean(axis=1)
+    for factor in FACTORS:
+        table[f"{factor}_rank"] = ranks[factor]
+    return RankingTable(panel.generation, table)
+
+
+def get_ranking():
+    """
+    Returns the ranking for the current panel generation, rebuilding it only when the panel changed.
+    None when no panel has been published yet.
+    """
+    global _ranking
+    panel = load_panel()
+    if panel is None:
+        return None
+    ranking = _ranking
+    if ranking is not None and ranking.generation == panel.generation:
+        return ranking
+    with _ranking_lock:
+        if _ranking is None or _ranking.generation != panel.generation:
+            from data_fetcher import fetch_tw_stock_list
+
+            industries = {stock['ticker']: stock['industry'] for stock in fetch_tw_stock_list() or []}
+            _ranking = build_ranking(panel, industries)
+            print(f"✅ 排名表已更新: 第 {panel.generation} 代, {len(_ranking.table)} 支股票")
+        return _ranking
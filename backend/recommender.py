@@ -1,7 +1,9 @@
 import pandas as pd
 import numpy as np
 from data_fetcher import fetch_data, get_ticker_info, fetch_tw_stock_list
-from strategy import add_indicators
+from strategy import add_indicators, calculate_trade_levels
+from price_panel import normalize_ohlcv
+from profiler import profile_stage, profiled
 from datetime import datetime, timedelta
 
 
@@ -17,12 +19,13 @@ def find_candidates(tickers):
     print(f"正在分析 {len(tickers)} 支股票...")
 
     try:
-        data = fetch_data(
-            tickers,
-            start_date=(datetime.now() - timedelta(days=60)).strftime('%Y-%m-%d'),
-            end_date=datetime.now().strftime('%Y-%m-%d'),
-            interval="1d"
-        )
+        with profile_stage("fetch"):
+            data = fetch_data(
+                tickers,
+                start_date=(datetime.now() - timedelta(days=60)).strftime('%Y-%m-%d'),
+                end_date=datetime.now().strftime('%Y-%m-%d'),
+                interval="1d"
+            )
 
         for ticker in tickers:
             if ticker not in data:
@@ -113,99 +116,147 @@ def find_candidates(tickers):
     print(f"找到 {len(candidates)} 支候選股票: {candidates}")
     return candidates
 
-def generate_recommendations(candidates):
+# 推薦只需要最近 10 個交易日，抓 30 個日曆日才能涵蓋農曆春節等長假
+RECOMMEND_LOOKBACK = 10
+RECOMMEND_WINDOW_DAYS = 30
+
+
+def _field_matrix(data, field):
+    """Align one OHLCV field of {ticker: DataFrame} into a (date, ticker) DataFrame."""
+    columns = {}
+    for ticker, df in data.items():
+        if df is None or df.empty:
+            continue
+        df = normalize_ohlcv(df)
+        columns[ticker] = df[field].astype(float)
+    if not columns:
+        return pd.DataFrame()
+    return pd.concat(columns, axis=1).sort_index()
+
+
+def compute_recommendation_levels(data, lookback=RECOMMEND_LOOKBACK):
     """
-    Generates entry and exit recommendations for a list of candidate stocks.
+    Computes support/resistance, entry range, target, stop-loss, risk/reward and rating
+    for every ticker at once. Returns a numeric DataFrame indexed by ticker.
+    """
+    close = _field_matrix(data, 'Close')
+    if close.empty:
+        return pd.DataFrame()
+    high = _field_matrix(data, 'High').reindex(index=close.index, columns=close.columns)
+    low = _field_matrix(data, 'Low').reindex(index=close.index, columns=close.columns)
+
+    latest_price = close.ffill().iloc[-1].to_numpy()
+    # 每支股票各自最後 lookback 根有效 K 棒（停牌或過時資料的股票結束得較早）
+    has_bar = close.notna().to_numpy()
+    bars_from_end = np.cumsum(has_bar[::-1], axis=0)[::-1]
+    recent = has_bar & (bars_from_end <= lookback)
+    support = low.where(recent).min().to_numpy()
+    resistance = high.where(recent).max().to_numpy()
+    trade_levels = calculate_trade_levels(latest_price, support, resistance)
+    price_range = trade_levels["price_range"]
+
+    levels = pd.DataFrame({
+        "current_price": latest_price,
+        "entry_low": trade_levels["entry_low"],
+        "entry_high": trade_levels["entry_high"],
+        "target_profit": trade_levels["target_profit"],
+        "stop_loss": trade_levels["stop_loss"],
+        "risk_reward_ratio": trade_levels["risk_reward_ratio"],
+        "support": support,
+        "resistance": resistance,
+        "rating": trade_levels["rating"],
+        "potential_return": trade_levels["potential_return"],
+    }, index=close.columns)
+
+    valid = np.isfinite(latest_price) & np.isfinite(price_range) & (price_range > 0)
+    for ticker in levels.index[~valid]:
+        print(f"⚠️  {ticker}: 價格區間無效")
+    return levels[valid]
+
+
+def fetch_recommendation_levels(candidates, deadline=None):
+    """
+    Fetches exactly the recent window for all candidates once and computes their levels.
+    The "stale" column marks tickers served from stored data; tickers with no data at all
+    are listed in levels.attrs['skipped'].
+    """
+    with profile_stage("fetch"):
+        data = fetch_data(
+            candidates,
+            start_date=(datetime.now() - timedelta(days=RECOMMEND_WINDOW_DAYS)).strftime('%Y-%m-%d'),
+            end_date=datetime.now().strftime('%Y-%m-%d'),
+            interval="1d",
+            deadline=deadline
+        )
+    skipped = [ticker for ticker in candidates if ticker not in data]
+    for ticker in skipped:
+        print(f"⚠️  {ticker}: 無法獲取詳細數據")
+    with profile_stage("scoring"):
+        levels = compute_recommendation_levels(data)
+    if not levels.empty:
+        levels["stale"] = [bool(data[ticker].attrs.get('stale', False)) for ticker in levels.index]
+    levels.attrs['skipped'] = skipped
+    return levels
+
+
+@profiled("formatting")
+def format_recommendations(table):
+    """Formats the numeric levels into the response dicts; only done at the API boundary."""
+    recommendations = []
+    for ticker, row in zip(table.index, table.itertuples(index=False)):
+        recommendations.append({
+            "ticker": ticker,
+            "name": row.name,
+            "current_price": f"{row.current_price:.2f}",
+            "entry_price_range": f"{row.entry_low:.2f} - {row.entry_high:.2f}",
+            "target_profit": f"{row.target_profit:.2f}",
+            "stop_loss": f"{row.stop_loss:.2f}",
+            "risk_reward_ratio": f"{row.risk_reward_ratio:.2f}",
+            "support": f"{row.support:.2f}",
+            "resistance": f"{row.resistance:.2f}",
+            "rating": row.rating,
+            "potential_return": f"{row.potential_return:.1f}%"
+        })
+    return recommendations
+
+
+def generate_recommendation_table(candidates, deadline=None):
+    """
+    Generates the numeric recommendation table (one row per ticker, with names) for a list of candidates.
+    With a deadline, late tickers come from stored data (stale column) or end up in table.attrs['skipped'].
     """
     if not candidates:
         print("沒有候選股票，直接返回空推薦")
-        return []
+        return pd.DataFrame()
 
     all_stocks_with_names = fetch_tw_stock_list()
     name_map = {stock['ticker']: stock['name'] for stock in all_stocks_with_names}
 
-    recommendations = []
     print(f"正在生成 {len(candidates)} 支股票的推薦...")
 
     try:
-        data = fetch_data(candidates, period="10d", interval="1d")
-
-        for ticker in candidates:
-            if ticker not in data:
-                print(f"⚠️  {ticker}: 無法獲取詳細數據")
-                continue
-
-            df = data[ticker]
-            if df is None or df.empty:
-                print(f"⚠️  {ticker}: 詳細數據為空")
-                continue
-
-            try:
-                latest_price = float(df['Close'].iloc[-1])
-
-                recent_data = df.tail(min(10, len(df)))
-
-                support = float(recent_data['Low'].min())
-                resistance = float(recent_data['High'].max())
-
-                price_range = resistance - support
-
-                if price_range <= 0:
-                    print(f"⚠️  {ticker}: 價格區間無效")
-                    continue
-
-                entry_low = support
-                entry_high = support + (price_range * 0.4)
-
-                target_price = resistance - (price_range * 0.1)
-
-                stop_loss = support - (price_range * 0.15)
-
-                if stop_loss < latest_price * 0.85:
-                    stop_loss = latest_price * 0.95
-
-                potential_gain = target_price - entry_high
-                potential_loss = entry_high - stop_loss
-                risk_reward_ratio = potential_gain / potential_loss if potential_loss > 0 else 0
-
-                if risk_reward_ratio > 2:
-                    rating = "強烈推薦"
-                elif risk_reward_ratio > 1.5:
-                    rating = "推薦"
-                elif risk_reward_ratio > 1:
-                    rating = "謹慎推薦"
-                else:
-                    rating = "不推薦"
-
-                stock_name = name_map.get(ticker, ticker)
-
-                recommendation = {
-                    "ticker": ticker,
-                    "name": stock_name,
-                    "current_price": f"{latest_price:.2f}",
-                    "entry_price_range": f"{entry_low:.2f} - {entry_high:.2f}",
-                    "target_profit": f"{target_price:.2f}",
-                    "stop_loss": f"{stop_loss:.2f}",
-                    "risk_reward_ratio": f"{risk_reward_ratio:.2f}",
-                    "support": f"{support:.2f}",
-                    "resistance": f"{resistance:.2f}",
-                    "rating": rating,
-                    "potential_return": f"{((target_price - entry_high) / entry_high * 100):.1f}%"
-                }
-
-                recommendations.append(recommendation)
-                print(f"✅ {ticker}: 推薦已生成 ({rating})")
-
-            except Exception as e:
-                print(f"❌ {ticker}: 推薦生成錯誤 - {str(e)}")
-                import traceback
-                traceback.print_exc()
-                continue
+        table = fetch_recommendation_levels(candidates, deadline)
+        if table.empty:
+            return table
+        table.insert(0, "name", [name_map.get(ticker, ticker) for ticker in table.index])
+        print(f"✅ 已生成 {len(table)} 支股票的推薦")
+        return table
 
     except Exception as e:
         print(f"推薦生成整體錯誤: {str(e)}")
         import traceback
         traceback.print_exc()
+        return pd.DataFrame()
+
+
+def generate_recommendations(candidates):
+    """
+    Generates entry and exit recommendations for a list of candidate stocks.
+    """
+    table = generate_recommendation_table(candidates)
+    if table.empty:
+        return []
+    return format_recommendations(table)
 
 
 if __name__ == '__main__':
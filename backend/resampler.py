@@ -0,0 +1,149 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# 由基礎 K 棒在本地合成較長週期：週 / 月線來自日線，5m / 15m / 60m 來自本地 1m 價格庫，
+# 不再為每個週期各自向 Yahoo 下載。
+BASE_INTERVAL = {
+    "1wk": "1d",
+    "1mo": "1d",
+    "5m": "1m",
+    "15m": "1m",
+    "60m": "1m",
+}
+RULES = {
+    "1wk": pd.offsets.Week(weekday=4),
+    "1mo": pd.offsets.MonthEnd(),
+    "5m": pd.offsets.Minute(5),
+    "15m": pd.offsets.Minute(15),
+    "60m": pd.offsets.Minute(60),
+}
+# 年化用的每年 K 棒數（台股每日 270 分鐘）
+PERIODS_PER_YEAR = {
+    "1d": 252,
+    "1wk": 52,
+    "1mo": 12,
+    "1m": 252 * 270,
+    "5m": 252 * 54,
+    "15m": 252 * 18,
+    "60m": 252 * 5,
+}
+# Yahoo 分鐘線可回溯的日曆天數（1m 約 7 天，5m / 15m 約 60 天，60m 約 730 天）
+INTRADAY_HISTORY_DAYS = {
+    "1m": 7,
+    "5m": 60,
+    "15m": 60,
+    "60m": 730,
+}
+AGGREGATION = {
+    'Open': 'first',
+    'High': 'max',
+    'Low': 'min',
+    'Close': 'last',
+    'Volume': 'sum',
+    '_first': 'first',
+}
+
+_CACHE_SIZE = 4096
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def is_derived(interval):
+    return interval in BASE_INTERVAL
+
+
+def covers_history(interval, start_date=None):
+    """Whether Yahoo still serves bars of this interval back to start_date (default: one year ago, as fetch_data)."""
+    days = INTRADAY_HISTORY_DAYS.get(interval)
+    if days is None:
+        return True
+    start = pd.Timestamp(start_date) if start_date else pd.Timestamp(datetime.now() - timedelta(days=365))
+    return start >= pd.Timestamp(datetime.now() - timedelta(days=days))
+
+
+def resample_ohlcv(df, interval):
+    """Aggregates an OHLCV frame to the given interval; empty buckets (holidays, lunch) are dropped."""
+    frame = df[['Open', 'High', 'Low', 'Close', 'Volume']].copy()
+    frame['_first'] = frame.index
+    bars = frame.resample(RULES[interval]).agg(AGGREGATION)
+    return bars.dropna(subset=['Close'])
+
+
+def _cached_resample(ticker, interval, base):
+    """
+    Resamples incrementally: when the base only grew at the end, the buckets before the last one are
+    reused and only base rows from the start of the last (possibly partial) bucket are re-aggregated.
+    Any change to the start of the base (e.g. re-adjusted history after a dividend) forces a full pass.
+    """
+    key = (ticker, interval)
+    with _cache_lock:
+        entry = _cache.get(key)
+
+    first_ts = base.index[0]
+    first_close = float(base['Close'].iloc[0])
+    if (
+        entry is not None
+        and entry["first_ts"] == first_ts
+        and entry["first_close"] == first_close
+        and base.index[-1] >= entry["last_ts"]
+        and len(entry["bars"]) > 0
+    ):
+        cached = entry["bars"]
+        cutoff = cached['_first'].iloc[-1]
+        tail = resample_ohlcv(base[base.index >= cutoff], interval)
+        bars = pd.concat([cached.iloc[:-1], tail])
+    else:
+        bars = resample_ohlcv(base, interval)
+
+    with _cache_lock:
+        _cache[key] = {"bars": bars, "first_ts": first_ts, "first_close": first_close, "last_ts": base.index[-1]}
+        _cache.move_to_end(key)
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return bars.drop(columns=['_first'])
+
+
+def resample_data(data, interval):
+    """Resamples {ticker: base DataFrame} (as returned by fetch_data) to the derived interval."""
+    result = {}
+    for ticker, df in data.items():
+        if df is None or df.empty:
+            continue
+        if isinstance(df.columns, pd.MultiIndex):
+            df = df.copy()
+            df.columns = df.columns.get_level_values(0)
+        bars = _cached_resample(ticker, interval, df.sort_index())
+        if not bars.empty:
+            result[ticker] = bars
+    return result
+
+
+def fetch_resampled(tickers, interval, start_date=None, end_date=None, **kwargs):
+    """
+    Fetches the base interval through fetch_data (panel / local store) and derives the requested bars.
+    Minute bars are derived only from the local 1m store; when the store cannot cover the range
+    (older than one 1m request and not stored yet) the requested interval is downloaded directly,
+    which is smaller than a fresh 1m download.
+    """
+    from data_fetcher import fetch_data, download_history
+    from price_store import INTRADAY_INTERVAL, intraday_covers
+
+    if isinstance(tickers, str):
+        tickers = [tickers]
+    if BASE_INTERVAL[interval] == INTRADAY_INTERVAL and not (
+        kwargs.get("use_store", True) and intraday_covers(tickers, start_date)
+    ):
+        if not start_date and not end_date:
+            end_date = datetime.now().strftime('%Y-%m-%d')
+            start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+        print(f"本地 1m 資料無法涵蓋 {start_date} 起的區間，直接下載 {interval} K 棒")
+        return download_history(tickers, start_date, end_date, interval, deadline=kwargs.get("deadline"))
+
+    base = fetch_data(tickers, start_date=start_date, end_date=end_date, interval=BASE_INTERVAL[interval], **kwargs)
+    resampled = resample_data(base, interval)
+    for ticker, bars in resampled.items():
+        bars.attrs['stale'] = base[ticker].attrs.get('stale', False)
+    return resampled
@@ -0,0 +1,98 @@
+import os
+import time
+import threading
+from collections import deque
+
+# 請求延遲預算與 Yahoo 斷路器：逾時的股票改用本地舊資料或標示為略過，
+# 上游錯誤率過高時暫停呼叫，避免單一壞掉的分鐘拖垮整個產業掃描。
+DEFAULT_REQUEST_BUDGET = float(os.environ.get("REQUEST_BUDGET_SECONDS", 20))
+
+
+class Deadline:
+    """Latency budget carried through the fetch and analysis stages of one request."""
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, cap):
+        """Per-call timeout: the smaller of cap and the remaining budget (at least 1 second)."""
+        return max(1.0, min(cap, self.remaining()))
+
+
+def request_deadline(budget_ms=None):
+    """Deadline from an explicit budget in milliseconds, or the configured default."""
+    seconds = budget_ms / 1000 if budget_ms else DEFAULT_REQUEST_BUDGET
+    return Deadline(seconds)
+
+
+def scan_status(table):
+    """Stale / skipped tickers of a recommendation table, for the response envelope."""
+    stale = list(table.index[table["stale"]]) if "stale" in table.columns else []
+    return {"stale": stale, "skipped": list(table.attrs.get("skipped", []))}
+
+
+class CircuitBreaker:
+    """
+    Opens when at least min_calls calls in the last window seconds failed at failure_rate or more.
+    While open every call is refused; after cooldown one trial call is let through (half-open),
+    and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, name, failure_rate=0.5, min_calls=10, window=60, cooldown=30):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self._calls = deque()
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record(self, ok):
+        now = time.monotonic()
+        with self._lock:
+            if self._opened_at is not None:
+                self._trial_in_flight = False
+                if ok:
+                    print(f"✅ 斷路器 {self.name} 已恢復")
+                    self._opened_at = None
+                    self._calls.clear()
+                else:
+                    self._opened_at = now
+                return
+            self._calls.append((now, ok))
+            while self._calls and now - self._calls[0][0] > self.window:
+                self._calls.popleft()
+            failures = sum(1 for _, call_ok in self._calls if not call_ok)
+            if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.failure_rate:
+                print(f"⛔ 斷路器 {self.name} 開啟: {failures}/{len(self._calls)} 次呼叫失敗")
+                self._opened_at = now
+
+    def release(self):
+        """Ends a call whose outcome says nothing about upstream health; only frees a half-open trial."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+
+yahoo_breaker = CircuitBreaker("yahoo")
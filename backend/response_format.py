@@ -0,0 +1,90 @@
+from fastapi.responses import ORJSONResponse, Response
+
+from profiler import profiled
+
+# 大量推薦結果的欄式輸出：數值欄位以陣列傳送，不再逐列格式化成字串
+COLUMNAR_MEDIA_TYPE = "application/vnd.columnar+json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+NUMERIC_COLUMNS = [
+    "current_price", "entry_low", "entry_high", "target_profit", "stop_loss",
+    "risk_reward_ratio", "support", "resistance", "potential_return"
+]
+
+
+def negotiate_format(request, format=None):
+    """
+    Picks the response format from the ?format= flag or the Accept header.
+    Returns "arrow", "columnar" or "rows" (the default list-of-dicts payload).
+    """
+    if format in ("arrow", "columnar", "rows"):
+        return format
+    accept = request.headers.get("accept", "") if request is not None else ""
+    if ARROW_MEDIA_TYPE in accept:
+        return "arrow"
+    if COLUMNAR_MEDIA_TYPE in accept:
+        return "columnar"
+    return "rows"
+
+
+@profiled("formatting")
+def to_columns(table):
+    """Converts a recommendation table to {column: array}; numeric columns stay numeric (2 dp)."""
+    import numpy as np
+
+    columns = {
+        "ticker": list(table.index),
+        "name": table["name"].tolist() if "name" in table.columns else list(table.index),
+    }
+    for column in NUMERIC_COLUMNS:
+        columns[column] = np.round(table[column].to_numpy(dtype=np.float64), 2)
+    columns["rating"] = table["rating"].tolist()
+    if "stale" in table.columns:
+        columns["stale"] = table["stale"].tolist()
+    return columns
+
+
+def columnar_response(table, **envelope):
+    """Column-oriented JSON; numpy arrays are serialized natively by orjson."""
+    content = dict(envelope)
+    content["format"] = "columnar"
+    content["count"] = len(table)
+    content["recommendations"] = to_columns(table) if len(table) else {}
+    return ORJSONResponse(content, media_type=COLUMNAR_MEDIA_TYPE)
+
+
+def arrow_response(table, **envelope):
+    """Arrow IPC stream of the recommendation table; falls back to columnar JSON without pyarrow."""
+    import orjson
+
+    try:
+        import pyarrow as pa
+    except ImportError:
+        print("⚠️  未安裝 pyarrow，改用欄式 JSON 回應")
+        return columnar_response(table, **envelope)
+
+    columns = to_columns(table) if len(table) else {"ticker": [], "name": [], "rating": []}
+    # Schema metadata is string-only: scalars as text, lists (stale / skipped tickers) as JSON
+    metadata = {
+        key: str(value) if isinstance(value, (str, int, float)) else orjson.dumps(value).decode()
+        for key, value in envelope.items() if value is not None
+    }
+    arrow_table = pa.table(columns).replace_schema_metadata(metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, arrow_table.schema) as writer:
+        writer.write_table(arrow_table)
+    return Response(sink.getvalue().to_pybytes(), media_type=ARROW_MEDIA_TYPE)
+
+
+def recommendation_response(table, response_format, rows_builder, **envelope):
+    """
+    Builds the response for a recommendation table in the negotiated format.
+    rows_builder turns the table into the legacy list of formatted dicts.
+    """
+    if response_format == "arrow":
+        return arrow_response(table, **envelope)
+    if response_format == "columnar":
+        return columnar_response(table, **envelope)
+    content = dict(envelope)
+    content["recommendations"] = rows_builder(table) if len(table) else []
+    return content
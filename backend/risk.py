@@ -0,0 +1,244 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from price_panel import load_panel
+
+# 全市場滾動報酬共變異數：以環形緩衝區保存最近 window 天的報酬（float32），
+# 並維護報酬和與交叉乘積矩陣，新交易日只需做一次 rank-k 更新，不必每次重算 .corr()。
+DEFAULT_WINDOW = 60
+DEFAULT_MAX_CORRELATION = 0.8
+
+# 每個視窗長度各自一個模型（例如預設 60 天與 /risk/correlation?window= 指定的其他長度），
+# 交替使用不同視窗時不必重建；每個模型約 n² 個 float32，因此只保留最近使用的幾個
+_MODEL_CACHE_SIZE = 4
+_models = OrderedDict()
+_model_lock = threading.Lock()
+
+
+class RollingCovariance:
+    """Incrementally updated covariance/correlation of daily log returns for a fixed ticker universe."""
+
+    def __init__(self, tickers, window=DEFAULT_WINDOW):
+        self.tickers = list(tickers)
+        self.ticker_index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.window = window
+        n = len(self.tickers)
+        self.buffer = np.zeros((window, n), dtype=np.float32)
+        self.sums = np.zeros(n, dtype=np.float64)
+        self.cross = np.zeros((n, n), dtype=np.float32)
+        self.count = 0
+        self.position = 0
+        self.updates_since_rebuild = 0
+        self.last_date = None
+        self.last_close = None
+        self._correlation = None
+
+    def update(self, returns, last_date=None):
+        """
+        Adds new return rows (k, n); rows falling out of the window are subtracted in the same pass.
+        Missing returns count as zero. The cross-product is rebuilt from the buffer once per window
+        so float32 round-off from repeated add/subtract does not accumulate.
+        """
+        returns = np.nan_to_num(np.asarray(returns, dtype=np.float32))
+        if returns.ndim == 1:
+            returns = returns[None, :]
+        if len(returns) >= self.window:
+            self.buffer[:] = returns[-self.window:]
+            self.count = self.window
+            self.position = 0
+            self._rebuild()
+        else:
+            k = len(returns)
+            slots = (self.position + np.arange(k)) % self.window
+            # 尚未填滿的槽位為 0，扣除時不影響結果
+            outgoing = self.buffer[slots]
+            self.cross += returns.T @ returns - outgoing.T @ outgoing
+            self.sums += returns.sum(axis=0, dtype=np.float64) - outgoing.sum(axis=0, dtype=np.float64)
+            self.buffer[slots] = returns
+            self.position = (self.position + k) % self.window
+            self.count = min(self.window, self.count + k)
+            self.updates_since_rebuild += k
+            if self.updates_since_rebuild >= self.window:
+                self._rebuild()
+        self.last_date = last_date
+        self._correlation = None
+
+    def replace_last(self, row):
+        """
+        Replaces the most recently added return row, e.g. a trading day ingested from a partial
+        intraday panel whose close has since changed.
+        """
+        if self.count == 0:
+            return
+        row = np.nan_to_num(np.asarray(row, dtype=np.float32))
+        slot = (self.position - 1) % self.window
+        old = self.buffer[slot].copy()
+        self.cross += np.outer(row, row) - np.outer(old, old)
+        self.sums += row.astype(np.float64) - old.astype(np.float64)
+        self.buffer[slot] = row
+        self._correlation = None
+
+    def _rebuild(self):
+        rows = self.buffer if self.count == self.window else self.buffer[:self.count]
+        self.cross = rows.T @ rows
+        self.sums = rows.sum(axis=0, dtype=np.float64)
+        self.updates_since_rebuild = 0
+
+    def covariance(self):
+        if self.count < 2:
+            return np.zeros_like(self.cross)
+        mean = (self.sums / self.count).astype(np.float32)
+        return (self.cross - self.count * np.outer(mean, mean)) / np.float32(self.count - 1)
+
+    def correlation(self):
+        """Full (n, n) float32 correlation matrix, cached until the next update."""
+        if self._correlation is None:
+            cov = self.covariance()
+            std = np.sqrt(np.clip(np.diag(cov), 0, None))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                corr = cov / np.outer(std, std)
+            corr = np.clip(np.nan_to_num(corr), -1.0, 1.0)
+            np.fill_diagonal(corr, 1.0)
+            self._correlation = corr.astype(np.float32, copy=False)
+        return self._correlation
+
+    def submatrix(self, tickers):
+        """Correlation among the requested tickers that the model knows; returns (tickers, matrix)."""
+        known = [ticker for ticker in tickers if ticker in self.ticker_index]
+        idx = np.array([self.ticker_index[ticker] for ticker in known], dtype=np.intp)
+        return known, self.correlation()[np.ix_(idx, idx)]
+
+
+def _log_returns(close):
+    """Daily log returns of a (date, ticker) close matrix, float32."""
+    close = np.asarray(close, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.diff(np.log(close), axis=0)
+    return returns.astype(np.float32)
+
+
+def build_from_close(close, window=DEFAULT_WINDOW):
+    """Builds a model from a (date, ticker) close DataFrame."""
+    model = RollingCovariance(close.columns, window)
+    returns = _log_returns(close.to_numpy())
+    if len(returns):
+        model.update(returns[-window:], last_date=close.index[-1])
+        model.last_close = close.to_numpy()[-1]
+    return model
+
+
+def get_risk_model(window=DEFAULT_WINDOW):
+    """
+    Returns the universe-wide model backed by the shared price panel.
+    A new panel generation with the same tickers re-ingests the last known trading day (its close may
+    have come from a partial intraday refresh) and feeds only the new days into the model;
+    a changed universe rebuilds it. Models are kept per window.
+    """
+    panel = load_panel()
+    if panel is None:
+        return None
+    with _model_lock:
+        model = _models.get(window)
+        if model is not None:
+            _models.move_to_end(window)
+        if model is not None and model.tickers == list(panel.tickers):
+            start = panel.dates.searchsorted(model.last_date) if model.last_date is not None else 0
+            if 0 < start < len(panel.dates) and panel.dates[start] == model.last_date:
+                close = panel.field('Close')[start - 1:]
+                if start == len(panel.dates) - 1 and np.array_equal(close[-1], model.last_close, equal_nan=True):
+                    return model
+                returns = _log_returns(close)
+                model.replace_last(returns[0])
+                if len(returns) > 1:
+                    model.update(returns[1:], last_date=panel.dates[-1])
+                model.last_close = np.array(close[-1])
+                return model
+        close = pd.DataFrame(panel.field('Close')[-(window + 1):], index=panel.dates[-(window + 1):],
+                             columns=panel.tickers)
+        model = build_from_close(close, window)
+        _models[window] = model
+        _models.move_to_end(window)
+        while len(_models) > _MODEL_CACHE_SIZE:
+            _models.popitem(last=False)
+        return model
+
+
+def _fetch_close(tickers, start_date=None, deadline=None):
+    """(date, ticker) close DataFrame for tickers fetched outside the panel, within the request deadline."""
+    from data_fetcher import fetch_data
+    from price_panel import normalize_ohlcv
+
+    data = fetch_data(tickers, start_date=start_date, deadline=deadline)
+    if not data:
+        return pd.DataFrame()
+    return pd.concat({ticker: normalize_ohlcv(df)['Close'] for ticker, df in data.items()}, axis=1).sort_index()
+
+
+def correlation_for(tickers, window=DEFAULT_WINDOW, deadline=None):
+    """
+    Correlation among the given tickers. Pairs the universe model knows come from it; only tickers
+    missing from the panel are fetched, and their correlations are computed against the panel closes
+    over the same window. Without a panel everything comes from a one-off fetch of these tickers.
+    """
+    model = get_risk_model(window)
+    panel = load_panel() if model is not None else None
+    if panel is None or model.tickers != list(panel.tickers):
+        close = _fetch_close(tickers, deadline=deadline)
+        if close.empty:
+            return [], np.zeros((0, 0), dtype=np.float32)
+        return build_from_close(close.tail(window + 1), window).submatrix(tickers)
+
+    missing = [ticker for ticker in tickers if ticker not in model.ticker_index]
+    if not missing:
+        return model.submatrix(tickers)
+
+    dates = panel.dates[-(window + 1):]
+    fetched = _fetch_close(missing, start_date=dates[0].strftime('%Y-%m-%d'), deadline=deadline)
+    known = [ticker for ticker in tickers if ticker in model.ticker_index or ticker in fetched.columns]
+    in_panel = [ticker for ticker in known if ticker in model.ticker_index]
+    idx = np.array([model.ticker_index[ticker] for ticker in in_panel], dtype=np.intp)
+    close = pd.DataFrame(panel.field('Close')[-(window + 1):][:, idx], index=dates, columns=in_panel)
+    if not fetched.empty:
+        close = close.join(fetched.reindex(dates))
+    combined = build_from_close(close[known], window)
+    known, corr = combined.submatrix(known)
+    # 面板內股票之間的相關係數以全市場模型為準
+    position = np.array([i for i, ticker in enumerate(known) if ticker in model.ticker_index], dtype=np.intp)
+    corr = corr.copy()
+    corr[np.ix_(position, position)] = model.submatrix(in_panel)[1]
+    return known, corr
+
+
+def diversify(tickers, max_correlation=DEFAULT_MAX_CORRELATION, window=DEFAULT_WINDOW, deadline=None):
+    """
+    Greedy diversification: walks tickers in priority order and keeps one only if its correlation
+    with every name already kept is at most max_correlation. Unknown tickers are kept.
+    """
+    known, corr = correlation_for(tickers, window, deadline)
+    position = {ticker: i for i, ticker in enumerate(known)}
+    kept = []
+    kept_idx = []
+    for ticker in tickers:
+        i = position.get(ticker)
+        if i is not None and kept_idx and np.max(corr[i, kept_idx]) > max_correlation:
+            print(f"⚠️  {ticker}: 與已選股票相關性過高，略過")
+            continue
+        kept.append(ticker)
+        if i is not None:
+            kept_idx.append(i)
+    return kept
+
+
+def diversify_table(table, max_correlation=DEFAULT_MAX_CORRELATION, window=DEFAULT_WINDOW, deadline=None):
+    """
+    Orders a recommendation table by risk/reward and drops names too correlated with better-ranked ones.
+    Tickers that cannot be fetched within the deadline are kept (treated as uncorrelated).
+    """
+    if table.empty:
+        return table
+    ranked = table.sort_values('risk_reward_ratio', ascending=False)
+    kept = diversify(list(ranked.index), max_correlation, window, deadline)
+    return ranked.loc[kept]
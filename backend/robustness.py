@@ -0,0 +1,152 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from strategy import ma_crossover_signal_matrix
+
+# 穩健性分析：對報酬序列做區塊 bootstrap，將所有重抽樣路徑堆成 (resamples, bars) 矩陣，
+# 一次以陣列運算重跑策略並計算績效指標，最後回報各指標的信賴區間。
+# 每條路徑套用與 run_backtest（simple 引擎）相同的部位與成交規則，點估計因此與 /api/backtest 一致。
+DEFAULT_RESAMPLES = 10000
+DEFAULT_BLOCK_SIZE = 20
+CHUNK_SIZE = 1000
+METRICS = ["totalReturn", "sharpeRatio", "maxDrawdown"]
+MODEL = {
+    "engine": "simple",
+    "position": "Signal 股數（多頭 1 股 / 空頭 -1 股），於訊號當根收盤價成交",
+    "costs": "不計手續費與稅",
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def block_bootstrap_indices(rng, n_resamples, length, block_size):
+    """Moving-block bootstrap: (n_resamples, length) indices made of random contiguous blocks."""
+    block_size = max(1, min(block_size, length))
+    n_blocks = -(-length // block_size)
+    starts = rng.integers(0, length - block_size + 1, size=(n_resamples, n_blocks))
+    indices = starts[:, :, None] + np.arange(block_size)
+    return indices.reshape(n_resamples, -1)[:, :length]
+
+
+def evaluate_paths(log_returns, start_price, strategy_params, periods_per_year=252, initial_capital=100000.0):
+    """
+    Runs the MA crossover on every path of a (paths, bars) log-return matrix and returns metric arrays.
+    Same rules as run_backtest: the position is the Signal in shares, changed at the close of the
+    signal bar, with no costs; cash, equity, Sharpe and drawdown are computed the same way.
+    """
+    prices = start_price * np.exp(np.cumsum(log_returns, axis=1))
+    prices = np.concatenate([np.full((len(prices), 1), start_price), prices], axis=1)
+    signal = ma_crossover_signal_matrix(prices, **strategy_params)
+
+    position_change = np.diff(signal, axis=1, prepend=0.0)
+    cash = initial_capital - np.cumsum(position_change * prices, axis=1)
+    equity = cash + signal * prices
+    returns = equity[:, 1:] / equity[:, :-1] - 1
+
+    total_return = (equity[:, -1] / initial_capital - 1) * 100
+    std = returns.std(axis=1, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 0, np.sqrt(periods_per_year) * returns.mean(axis=1) / std, 0.0)
+    running_max = np.maximum.accumulate(equity, axis=1)
+    max_drawdown = np.abs(((equity - running_max) / running_max).min(axis=1)) * 100
+    return {"totalReturn": total_return, "sharpeRatio": sharpe, "maxDrawdown": max_drawdown}
+
+
+def _evaluate_chunk(args):
+    """Process-pool worker: draws one chunk of resamples with its own seed and evaluates them."""
+    log_returns, start_price, strategy_params, n_resamples, block_size, seed, periods_per_year, initial_capital = args
+    rng = np.random.default_rng(seed)
+    indices = block_bootstrap_indices(rng, n_resamples, len(log_returns), block_size)
+    return evaluate_paths(log_returns[indices], start_price, strategy_params, periods_per_year, initial_capital)
+
+
+def _get_pool():
+    """
+    Process pool shared by all requests. Workers are started with forkserver (spawn where unavailable):
+    forking a threaded API worker can deadlock the children and copies its caches.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=context)
+        return _pool
+
+
+def _reset_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def run_robustness(data, strategy_params, n_resamples=DEFAULT_RESAMPLES, block_size=DEFAULT_BLOCK_SIZE,
+                   confidence=0.95, seed=None, max_workers=None, periods_per_year=252, initial_capital=100000.0):
+    """
+    Block-bootstraps the close-to-close returns of data and re-evaluates the MA crossover strategy
+    on every resample, under the simple engine's rules (see MODEL). Chunks of CHUNK_SIZE resamples
+    are spread over the shared process pool; max_workers=1 evaluates them in-process.
+    Returns the point estimate on the actual series and confidence intervals for each metric.
+    """
+    close = data['Close']
+    if hasattr(close, 'columns'):
+        close = close.iloc[:, 0]
+    close = close.dropna().to_numpy(dtype=float)
+    long_window = strategy_params.get("long_window", 20)
+    if len(close) < max(long_window, block_size) + 2:
+        raise ValueError("數據不足以進行穩健性分析")
+
+    log_returns = np.diff(np.log(close))
+    point = {key: float(value[0]) for key, value in
+             evaluate_paths(log_returns[None, :], close[0], strategy_params, periods_per_year,
+                            initial_capital).items()}
+
+    chunks = [CHUNK_SIZE] * (n_resamples // CHUNK_SIZE)
+    if n_resamples % CHUNK_SIZE:
+        chunks.append(n_resamples % CHUNK_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    tasks = [(log_returns, close[0], strategy_params, size, block_size, s, periods_per_year, initial_capital)
+             for size, s in zip(chunks, seeds)]
+
+    if len(tasks) > 1 and (max_workers is None or max_workers > 1):
+        pool = _get_pool()
+        try:
+            results = list(pool.map(_evaluate_chunk, tasks))
+        except BrokenProcessPool:
+            # 工作行程異常結束時丟棄整個池，下次請求重新建立
+            _reset_pool(pool)
+            raise
+    else:
+        results = [_evaluate_chunk(task) for task in tasks]
+
+    alpha = (1 - confidence) / 2 * 100
+    summary = {}
+    for metric in METRICS:
+        values = np.concatenate([result[metric] for result in results])
+        low, median, high = np.percentile(values, [alpha, 50, 100 - alpha])
+        summary[metric] = {
+            "point": point[metric],
+            "mean": float(values.mean()),
+            "median": float(median),
+            "std": float(values.std()),
+            "ciLow": float(low),
+            "ciHigh": float(high),
+        }
+    total_returns = np.concatenate([result["totalReturn"] for result in results])
+
+    return {
+        "resamples": int(n_resamples),
+        "blockSize": int(block_size),
+        "confidence": float(confidence),
+        "probabilityOfLoss": float((total_returns < 0).mean()),
+        "model": MODEL,
+        "metrics": summary,
+    }
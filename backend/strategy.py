@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
 
+from profiler import profiled
+
 
 def calculate_ma(data, window):
     """Calculate the moving average."""
@@ -31,6 +33,46 @@ def detect_volume_spike(data, window=20, factor=1.5):
     return data['Volume'] > (avg_volume * factor)
 
 
+def calculate_trade_levels(latest_price, support, resistance):
+    """
+    Entry range, target, stop-loss, risk/reward and rating from support/resistance.
+    Works element-wise on scalars or arrays of any shape.
+    """
+    latest_price = np.asarray(latest_price, dtype=float)
+    support = np.asarray(support, dtype=float)
+    resistance = np.asarray(resistance, dtype=float)
+    price_range = resistance - support
+
+    entry_low = support
+    entry_high = support + price_range * 0.4
+    target_price = resistance - price_range * 0.1
+    stop_loss = support - price_range * 0.15
+    stop_loss = np.where(stop_loss < latest_price * 0.85, latest_price * 0.95, stop_loss)
+
+    potential_gain = target_price - entry_high
+    potential_loss = entry_high - stop_loss
+    with np.errstate(divide='ignore', invalid='ignore'):
+        risk_reward_ratio = np.where(potential_loss > 0, potential_gain / potential_loss, 0.0)
+        potential_return = (target_price - entry_high) / entry_high * 100
+
+    rating = np.select(
+        [risk_reward_ratio > 2, risk_reward_ratio > 1.5, risk_reward_ratio > 1],
+        ["強烈推薦", "推薦", "謹慎推薦"],
+        default="不推薦"
+    )
+    return {
+        "price_range": price_range,
+        "entry_low": entry_low,
+        "entry_high": entry_high,
+        "target_profit": target_price,
+        "stop_loss": stop_loss,
+        "risk_reward_ratio": risk_reward_ratio,
+        "rating": rating,
+        "potential_return": potential_return,
+    }
+
+
+@profiled("indicators")
 def add_indicators(data, indicators=['MA5', 'MA20', 'RSI', 'ATR', 'VolumeSpike'], short_window=5, long_window=20):
     """Add multiple indicators to the dataframe."""
     # 確保數據有正確的列名
@@ -64,6 +106,29 @@ def ma_crossover_strategy(data, short_window=5, long_window=20):
     return data
 
 
+def ma_crossover_signal_matrix(prices, short_window=5, long_window=20):
+    """
+    Vectorized ma_crossover_strategy over many price paths at once.
+    prices is (paths, bars); returns the same-shaped Signal matrix (1 / -1 / 0 before the long MA exists).
+    """
+    prices = np.asarray(prices, dtype=float)
+    cumsum = np.cumsum(prices, axis=1)
+    cumsum = np.concatenate([np.zeros((prices.shape[0], 1)), cumsum], axis=1)
+
+    def rolling_mean(window):
+        ma = np.full(prices.shape, np.nan)
+        if window <= prices.shape[1]:
+            ma[:, window - 1:] = (cumsum[:, window:] - cumsum[:, :-window]) / window
+        return ma
+
+    ma_short = rolling_mean(short_window)
+    ma_long = rolling_mean(long_window)
+    signal = np.zeros(prices.shape)
+    signal[ma_short > ma_long] = 1
+    signal[ma_short < ma_long] = -1
+    return signal
+
+
 if __name__ == '__main__':
     # 測試數據獲取和指標計算
     try: